@@ -1,17 +1,24 @@
 import geopandas as gpd
+import numpy as np
 import pandas as pd
 from shapely.geometry import Point, LineString
+from reliability import matching
+from reliability.artifacts import cached
+from reliability.data import get_network
+from reliability.matching import within
+from reliability.projection import METRIC_CRS, project
 
 
 #### 00 read data
-data_routes = gpd.read_file("../dat/geo-strecke/strecken_polyline.shp")
+# all routes and stations in metres (UTM 32N), so the distances mean the same everywhere in germany
+data_routes = get_network(metric=True).to_geodataframe("feature")
 data_mean = pd.read_csv("../doc/fig/trash/data_mean.csv", sep =";")
 
 # Create GeoDataFrame for routes
 gdf_routes = gpd.GeoDataFrame(data_routes, geometry = 'geometry')
 
 # Create GeoDataFrame for stations with coordinates
-gdf_stations = gpd.GeoDataFrame(data_mean, geometry = gpd.points_from_xy(data_mean["Coordinate Longitude"], data_mean["Coordinate Latitude"]))
+gdf_stations = gpd.GeoDataFrame(data_mean, geometry = gpd.points_from_xy(*project(data_mean["Coordinate Longitude"], data_mean["Coordinate Latitude"])), crs = METRIC_CRS)
 
 # add an empty column that will save the routes later on
 gdf_stations["route_ids"] = None
@@ -27,43 +34,45 @@ def is_point_on_line(point_coords, line_coords):
     return distance
 
 # Example usage
-point_coordinates = Point(9.38343, 54.74377)  # Example point coordinates
-line_coordinates = LineString([(9.38321, 54.74343), (9.38343, 54.74377), (9.38390, 54.74458), (9.38390, 54.74459)])  # Example line coordinates
+point_coordinates = Point(project(9.38343, 54.74377))  # Example point coordinates
+line_coordinates = LineString(zip(*project([9.38321, 9.38343, 9.38390, 9.38390], [54.74343, 54.74377, 54.74458, 54.74459])))  # Example line coordinates
 
 result = is_point_on_line(point_coordinates, line_coordinates)
 
-if result < 0.01:
+if result < 1000:
     print("In this example, the point is close to the line.")
 else:
     print("In this example, the point is not close to the line.")
 
 
-#### THE FOLLOWING LINES (CURRENTLY A COMMENT) TAKE A LONG TIME TO RUN, SO I SAVED THE RESULT AS CSV
-# # apply on the real data:
-# # check the distance of every station to every route
-# for row_route in gdf_routes["geometry"]:
-#     for row_point in gdf_stations["geometry"]:
-#         dist = is_point_on_line(row_point, row_route)
-#
-#         # if the distance is less than our threshold of 0.01 (which should translate to 0.7 to 1.11 km, depending on the latitude or longitude), we assume that the station is on the route
-#         if dist < 0.01:
-#             # get the indices of the rows
-#             index_point = gdf_stations.index.get_loc(gdf_stations[gdf_stations['geometry'] == row_point].index[0])
-#             index_route = gdf_routes.index.get_loc(gdf_routes[gdf_routes['geometry'] == row_route].index[0])
-#
-#             # only add the corresponding "strecken_nr" (that we get from the route-dataset) to the column, if it's a match
-#             gdf_stations["route_ids"].loc[index_point] = gdf_routes["strecke_nr"].loc[index_route]
-#
-#
-# # fill NaN values with 0
-# gdf_stations["route_ids"] = gdf_stations["route_ids"].fillna(0)
-# # save the dataframe as csv
-# gdf_stations.to_csv("../dat/cleaned data/gdf_stations.csv", index = False, header = True)
-
-
-
-# to safe time: load the dataset
-gdf_stations = pd.read_csv("../dat/cleaned data/gdf_stations.csv")
+# apply on the real data:
+# check the distance of every station to every route
+def match_stations_with_routes(gdf_routes, gdf_stations, threshold=1000):
+    gdf_stations = gdf_stations.copy()
+
+    # if the distance is less than our threshold of 1000 m (the 0.01 degrees we used before translate to 0.7 to 1.11 km, depending on the latitude or longitude), we assume that the station is on the route
+    # all these pairs are found in one query of a spatial index (STRtree) over the routes instead of computing every distance
+    index_point, index_route, _ = within(gdf_stations["geometry"].to_numpy(), gdf_routes["geometry"].to_numpy(), threshold)
+
+    # like looping over all routes: a station close to several routes keeps the last of them
+    order = np.lexsort((index_route, index_point))
+    index_point, index_route = index_point[order], index_route[order]
+    last = np.append(index_point[1:] != index_point[:-1], True)
+
+    # only add the corresponding "strecken_nr" (that we get from the route-dataset) to the column, if it's a match
+    route_ids = gdf_stations["route_ids"].to_numpy(copy=True)
+    route_ids[index_point[last]] = gdf_routes["strecke_nr"].to_numpy()[index_route[last]]
+    gdf_stations["route_ids"] = route_ids
+
+    # fill NaN values with 0
+    gdf_stations["route_ids"] = gdf_stations["route_ids"].fillna(0)
+    return gdf_stations
+
+
+# the result is cached: it is keyed by the routes, the stations, the threshold and the code of the matching
+# and only computed again when one of them changes
+gdf_stations = cached("gdf_stations", match_stations_with_routes, gdf_routes, gdf_stations, threshold=1000,
+                      depends=(matching,))
 
 
 
@@ -7,17 +7,21 @@ Created on Tue Jan 16 16:45:37 2024
 """
 
 import geopandas as gpd
+import shapely
 from shapely.geometry import MultiLineString, Point, LineString
 import matplotlib.pyplot as plt
-import networkx as nx
 import os
 import folium
+from reliability.data import get_graph, get_hubs, get_network
+from reliability.endpoints import RouteEndpoints
+from reliability.projection import project
 
 # Print the current working directory
 print("Current working directory: {0}".format(os.getcwd()))
 
-# Load the data
-gdf = gpd.read_file('../dat/geo-strecke/strecken_polyline.shp')
+# Load the data (from the binary cache of the shapefile, the shapefile itself is only read when it changed)
+network = get_network()
+gdf = network.to_geodataframe("feature")
 
 # Define coordinates for Stuttgart and Frankfurt am Main
 x_stuttgart, y_stuttgart = 9.18389001053732, 48.78312377049059
@@ -27,52 +31,25 @@ x_frankfurt, y_frankfurt = 8.6637837, 50.107288400393465
 stuttgart_point = Point(x_stuttgart, y_stuttgart)
 frankfurt_point = Point(x_frankfurt, y_frankfurt)
 
-# Group by 'strecke_nr' and create a MultiLineString for each unique 'strecke_nr'
-continuous_routes = (gdf.groupby('strecke_nr')['geometry'].apply(lambda x:
-                       MultiLineString(x.tolist())))
-continuous_gdf = gpd.GeoDataFrame(continuous_routes, columns=['geometry'])
-continuous_gdf['strecke_nr'] = continuous_gdf.index
+# One MultiLineString for each unique 'strecke_nr' (built from the cached offsets instead of a groupby)
+continuous_gdf = network.to_geodataframe("route")
 
-def find_route_connections(start_route, other_routes, threshold=50):
-    connections = []
-    start_route_num = start_route['strecke_nr']
-    for idx, other_route in other_routes.iterrows():
-        other_route_num = other_route['strecke_nr']
-        # Check and handle LineString and MultiLineString for start route
-        if isinstance(start_route['geometry'], LineString):
-            start_geoms = [start_route['geometry']]
-        elif isinstance(start_route['geometry'], MultiLineString):
-            start_geoms = list(start_route['geometry'])
-
-        # Check and handle LineString and MultiLineString for other route
-        if isinstance(other_route['geometry'], LineString):
-            other_geoms = [other_route['geometry']]
-        elif isinstance(other_route['geometry'], MultiLineString):
-            other_geoms = list(other_route['geometry'])
-
-        # Check distances between all parts of start_geoms and other_geoms
-        for part_start in start_geoms:
-            for part_other in other_geoms:
-                if part_start.distance(part_other) < threshold:
-                    connections.append((start_route_num, other_route_num))
-                    break
-            if connections:
-                break
-    return connections
-
-
-# Create the graph
-G = nx.Graph()
-for idx, route in continuous_gdf.iterrows():
-    # Add each route as a node
-    route_num = route['strecke_nr']
-    G.add_node(route_num, pos=route['geometry'].coords[:])
-
-    # Find connections to nearby routes
-    connections = find_route_connections(route['geometry'], continuous_gdf, threshold=50)
-    for conn in connections:
-        if conn[0] != conn[1]:  # Avoid self-loops
-            G.add_edge(conn[0], conn[1])
+# Endpoints of all routes with a spatial index over them and over the routes, for the route exploration below
+route_endpoints = RouteEndpoints(network)
+
+# Stations and route endpoints clustered into hubs (within 1 km), to look up the routes at a station or city
+hubs = get_hubs()
+
+# The same routes projected once into UTM 32N (also cached), all distances and thresholds below are in metres
+# continuous_gdf stays in longitude and latitude for the folium maps
+continuous_gdf_m = get_network(metric=True).to_geodataframe("route")
+
+# Load the graph (routes closer than 50 m are connected, see RouteTopology), memory-mapped from the cache
+# and only rebuilt when the network changes; the networkx view has length, delay and connecting point per edge
+route_graph = get_graph()
+G = route_graph.to_networkx()
+for route_num, route in continuous_gdf_m.iterrows():
+    G.nodes[route_num]['pos'] = shapely.get_coordinates(route['geometry'])
 
 # Plotting
 fig, ax = plt.subplots(figsize=(10, 10))
@@ -153,40 +130,15 @@ from shapely.geometry import Point, LineString, MultiLineString
 from shapely.ops import nearest_points
 import folium
 
-def get_furthest_point(geometry, reference_point):
-    # ... (same as before)
-    if isinstance(geometry, LineString):
-        # Directly access the first and last coordinates
-        coords = list(geometry.coords)
-        start, end = Point(coords[0]), Point(coords[-1])
-        return end if start.distance(reference_point) > end.distance(reference_point) else start
-    elif isinstance(geometry, MultiLineString):
-        furthest_point = None
-        max_distance = 0
-        for line in geometry.geoms:
-            coords = list(line.coords)
-            start, end = Point(coords[0]), Point(coords[-1])
-            for point in [start, end]:
-                distance = point.distance(reference_point)
-                if distance > max_distance:
-                    max_distance = distance
-                    furthest_point = point
-        return furthest_point
-    else:
-        raise TypeError("Geometry must be a LineString or MultiLineString")
+def get_furthest_point(route_num, reference_point):
+    # The endpoint (of any part) of the route that is furthest from the reference point, from the endpoint table
+    return route_endpoints.furthest(route_num, reference_point)
 
 
 def find_nearest_route(point, continuous_gdf):
-    # ... (same as before)
-    nearest_route = None
-    min_dist = float('inf')
-    for _, route in continuous_gdf.iterrows():
-        nearest_pt_on_route = nearest_points(point, route['geometry'])[1]
-        dist = point.distance(nearest_pt_on_route)
-        if dist < min_dist:
-            min_dist = dist
-            nearest_route = route
-    return nearest_route
+    # The nearest route through the spatial index, instead of the distance to every route
+    nearest_route_num, _ = route_endpoints.nearest(point)[0]
+    return continuous_gdf.loc[nearest_route_num]
 
 
 def random_color():
@@ -202,9 +154,9 @@ frankfurt_point = Point(8.6637837, 50.107288400393465)    # Replace with actual
 
 stuttgart_buffer = stuttgart_point.buffer(0.01)
 
-# Find routes within Stuttgart Hbf
-stuttgart_routes = continuous_gdf[continuous_gdf.intersects(stuttgart_buffer)]  # Adjust buffer size as needed
-stuttgart_routes = stuttgart_routes[stuttgart_routes.apply(lambda x: not get_furthest_point(x['geometry'], stuttgart_point).within(stuttgart_buffer), axis=1)]
+# Find routes within Stuttgart Hbf (the routes of its hub, instead of intersecting all routes with the buffer)
+stuttgart_routes = continuous_gdf.loc[hubs.routes_of("STUTTGART HBF")]
+stuttgart_routes = stuttgart_routes[stuttgart_routes.apply(lambda x: not get_furthest_point(x['strecke_nr'], stuttgart_point).within(stuttgart_buffer), axis=1)]
 
 
 # Initialize the map centered around Stuttgart
@@ -213,7 +165,7 @@ m = folium.Map(location=[stuttgart_point.y, stuttgart_point.x], zoom_start=12)
 # For each route that starts within Stuttgart, find its adjacent route
 for _, start_route in stuttgart_routes.iterrows():
     # Get the furthest endpoint of the starting route
-    end_point = get_furthest_point(start_route['geometry'], stuttgart_point)
+    end_point = get_furthest_point(start_route['strecke_nr'], stuttgart_point)
 
     # Find the nearest route to this endpoint
     adjacent_route = find_nearest_route(end_point, continuous_gdf)
@@ -241,7 +193,7 @@ for _, start_route in stuttgart_routes.iterrows():
     print(f"Stuttgart Route: {start_route_num}")
 
     # Get the furthest endpoint of the starting route
-    end_point = get_furthest_point(start_route['geometry'], stuttgart_point)
+    end_point = get_furthest_point(start_route['strecke_nr'], stuttgart_point)
 
     # Find the nearest route to this endpoint
     adjacent_route = find_nearest_route(end_point, continuous_gdf)
@@ -271,15 +223,8 @@ import folium
 # ... [Your existing functions like get_furthest_point, random_color here] ...
 
 def find_nearest_route(point, continuous_gdf):
-    nearest_route = None
-    min_dist = float('inf')
-    for _, route in continuous_gdf.iterrows():
-        nearest_pt_on_route = nearest_points(point, route['geometry'])[1]
-        dist = point.distance(nearest_pt_on_route)
-        if dist < min_dist:
-            min_dist = dist
-            nearest_route = route
-    return nearest_route
+    nearest_route_num, _ = route_endpoints.nearest(point)[0]
+    return continuous_gdf.loc[nearest_route_num]
 
 stuttgart_buffer = stuttgart_point.buffer(0.01)  # Define the buffer around Stuttgart
 
@@ -289,7 +234,7 @@ m = folium.Map(location=[stuttgart_point.y, stuttgart_point.x], zoom_start=12)
 # For each route that starts within Stuttgart, find its adjacent routes
 for _, start_route in stuttgart_routes.iterrows():
     current_route = start_route
-    end_point = get_furthest_point(current_route['geometry'], stuttgart_point)
+    end_point = get_furthest_point(current_route['strecke_nr'], stuttgart_point)
     adjacent_route = find_nearest_route(end_point, continuous_gdf)
 
     # Visualize the starting route
@@ -300,7 +245,7 @@ for _, start_route in stuttgart_routes.iterrows():
         add_line_to_map(adjacent_route['geometry'], m, 'red')
 
         # Find the next adjacent route (adjacent_route_2)
-        end_point_2 = get_furthest_point(adjacent_route['geometry'], end_point)
+        end_point_2 = get_furthest_point(adjacent_route['strecke_nr'], end_point)
         adjacent_route_2 = find_nearest_route(end_point_2, continuous_gdf)
 
         if adjacent_route_2 is not None and not end_point_2.within(stuttgart_buffer):
@@ -341,15 +286,8 @@ def add_line_to_map(geometry, line_map, line_color, route_num):
 
 
 def find_nearest_route(point, continuous_gdf):
-    nearest_route = None
-    min_dist = float('inf')
-    for _, route in continuous_gdf.iterrows():
-        nearest_pt_on_route = nearest_points(point, route['geometry'])[1]
-        dist = point.distance(nearest_pt_on_route)
-        if dist < min_dist:
-            min_dist = dist
-            nearest_route = route
-    return nearest_route
+    nearest_route_num, _ = route_endpoints.nearest(point)[0]
+    return continuous_gdf.loc[nearest_route_num]
 
 stuttgart_buffer = stuttgart_point.buffer(0.01)  # Define the buffer around Stuttgart
 
@@ -359,7 +297,7 @@ m = folium.Map(location=[stuttgart_point.y, stuttgart_point.x], zoom_start=12)
 # For each route that starts within Stuttgart, find its adjacent routes
 for _, start_route in stuttgart_routes.iterrows():
     current_route = start_route
-    end_point = get_furthest_point(current_route['geometry'], stuttgart_point)
+    end_point = get_furthest_point(current_route['strecke_nr'], stuttgart_point)
     adjacent_route = find_nearest_route(end_point, continuous_gdf)
 
     # Visualize the starting route with route number
@@ -370,7 +308,7 @@ for _, start_route in stuttgart_routes.iterrows():
         add_line_to_map(adjacent_route['geometry'], m, 'red', adjacent_route['strecke_nr'])
 
         # Find the next adjacent route (adjacent_route_2)
-        end_point_2 = get_furthest_point(adjacent_route['geometry'], end_point)
+        end_point_2 = get_furthest_point(adjacent_route['strecke_nr'], end_point)
         adjacent_route_2 = find_nearest_route(end_point_2, continuous_gdf)
 
         if adjacent_route_2 is not None and not end_point_2.within(stuttgart_buffer):
@@ -388,18 +326,11 @@ m
 #We choose this route as the start route from Stuttgart as it seems the most likely to move in the direction of Frankfurt
 # Find the endpoint of "strecke 4801"
 strecke_4801 = continuous_gdf[continuous_gdf['strecke_nr'] == 4801]
-endpoint_4801 = get_furthest_point(strecke_4801.iloc[0]['geometry'], stuttgart_point)
-
-# Find all routes and their distances to the endpoint of "strecke 4801"
-distances = []
-for _, route in continuous_gdf.iterrows():
-    if route['strecke_nr'] != 4801:  # Exclude "strecke 4801" itself
-        nearest_pt_on_route = nearest_points(endpoint_4801, route['geometry'])[1]
-        distance = endpoint_4801.distance(nearest_pt_on_route)
-        distances.append((route['strecke_nr'], distance, route['geometry']))
+endpoint_4801 = get_furthest_point(4801, stuttgart_point)
 
-# Select the nearest 5 routes to the endpoint of "strecke 4801"
-nearest_routes = sorted(distances, key=lambda x: x[1])[:5]
+# Select the nearest 5 routes to the endpoint of "strecke 4801" (excluding "strecke 4801" itself)
+nearest_routes = [(strecke_nr, distance, continuous_gdf.at[strecke_nr, 'geometry'])
+                  for strecke_nr, distance in route_endpoints.nearest(endpoint_4801, k=5, exclude=4801)]
 
 # Determine which route is closest to Frankfurt am Main
 min_distance_to_frankfurt = float('inf')
@@ -432,16 +363,9 @@ m
 #This was done to manually find the subsequent routes to Frankfurt, starting from Stuttgart
 # Find "strecke 4801"
 def find_nearby_routes(endpoint, continuous_gdf, exclude_route, max_routes=5):
-    distances = []
-    for _, route in continuous_gdf.iterrows():
-        if route['strecke_nr'] != exclude_route:  # Exclude the specified route
-            nearest_pt_on_route = nearest_points(endpoint, route['geometry'])[1]
-            distance = endpoint.distance(nearest_pt_on_route)
-            distances.append((route['strecke_nr'], distance, route['geometry']))
-
-    # Select the nearest routes to the endpoint
-    nearest_routes = sorted(distances, key=lambda x: x[1])[:max_routes]
-    return nearest_routes
+    # Select the nearest routes to the endpoint (except the specified route) through the spatial index
+    nearest_routes = route_endpoints.nearest(endpoint, k=max_routes, exclude=exclude_route)
+    return [(strecke_nr, distance, continuous_gdf.at[strecke_nr, 'geometry']) for strecke_nr, distance in nearest_routes]
 
 def find_route_closest_to_point(nearest_routes, target_point):
     min_distance_to_target = float('inf')
@@ -460,7 +384,7 @@ def find_route_closest_to_point(nearest_routes, target_point):
 strecke_4801 = continuous_gdf[continuous_gdf['strecke_nr'] == 4801]
 
 # Find the endpoint of "strecke 4801"
-endpoint_4801 = get_furthest_point(strecke_4801.iloc[0]['geometry'], stuttgart_point)
+endpoint_4801 = get_furthest_point(4801, stuttgart_point)
 
 # Find the nearest routes to the endpoint of "strecke 4801"
 nearest_routes = find_nearby_routes(endpoint_4801, continuous_gdf, 4801)
@@ -469,7 +393,7 @@ nearest_routes = find_nearby_routes(endpoint_4801, continuous_gdf, 4801)
 route_closest_to_frankfurt, route_closest_to_frankfurt_geometry = find_route_closest_to_point(nearest_routes, frankfurt_point)
 
 # Find the endpoint of the route leading closest to Frankfurt am Main
-endpoint_closest_to_frankfurt = get_furthest_point(route_closest_to_frankfurt_geometry, stuttgart_point)
+endpoint_closest_to_frankfurt = get_furthest_point(route_closest_to_frankfurt, stuttgart_point)
 
 # Find the nearest routes to the endpoint of the route closest to Frankfurt am Main
 next_nearest_routes = find_nearby_routes(endpoint_closest_to_frankfurt, continuous_gdf, route_closest_to_frankfurt)
@@ -503,7 +427,7 @@ from shapely.ops import nearest_points
 import folium
 
 # Define the functions (same as before)
-#def get_furthest_point(geometry, reference_point):
+#def get_furthest_point(route_num, reference_point):
     # ...
 
 #def find_nearest_route(point, continuous_gdf):
@@ -522,7 +446,8 @@ import folium
 m = folium.Map(location=[stuttgart_point.y, stuttgart_point.x], zoom_start=8)
 stuttgart_point = Point(9.18389001053732, 48.78312377049059)
 frankfurt_point = Point(8.6637837, 50.107288400393465)
-frankfurt_buffer = frankfurt_point.buffer(0.1)  # Define the buffer around Frankfurt am Main
+# Routes that lead into Frankfurt am Main: the routes of all hubs of its stations (instead of a buffer around the Hbf)
+routes_to_frankfurt = set(hubs.city_routes("FRANKFURT (MAIN)").tolist())
 
 # Initialize a list to store processed route numbers
 processed_routes = []
@@ -532,7 +457,7 @@ def process_routes(route, route_geometry, target_point, continuous_gdf, map_obj,
         return
 
     # Find the nearest routes to the endpoint of the current route
-    endpoint = get_furthest_point(route_geometry, stuttgart_point)
+    endpoint = get_furthest_point(route, stuttgart_point)
     nearest_routes = find_nearby_routes(endpoint, continuous_gdf, route, max_routes=10)
 
     # Filter down to the max 5 routes that lead nearest to the destination
@@ -544,7 +469,7 @@ def process_routes(route, route_geometry, target_point, continuous_gdf, map_obj,
         processed_list.append(strecke_nr)
 
         # Check if the route leads into the Frankfurt am Main buffer region
-        if geometry.intersects(frankfurt_buffer):
+        if strecke_nr in routes_to_frankfurt:
             # Highlight the route leading to Frankfurt am Main
             add_line_to_map(geometry, map_obj, 'green', strecke_nr)
         else:
@@ -572,24 +497,13 @@ print("Processed Routes:", processed_routes)
 #This is just to visualize all the stations in Germany - the data is obtained from a different dataset, which does not include route data
 import folium
 import pandas as pd
+from reliability.columnar import read_stations
+from reliability.store import AggregateStore
 
-# Load the data
-data_delay = pd.read_csv('/Users/User2/Desktop/Data Literacy/Data Literacy Project/db_data_2016.csv', delimiter=';')
-
-# Filter the DataFrame based on the condition
-data_delay = data_delay[data_delay['Country_y'] == 'DEUTSCHLAND']
-
-# Drop all NaN values
-data_delay = data_delay.dropna()
-
-# Group by 'Station or stop'
-grouped_delay = data_delay.groupby('Station or stop').agg({
-    'Name': 'first',  # Assuming the name is the same for all entries of each station
-    'Number of train rides': 'mean',
-    'Minutes of delay': 'mean',
-    'Coordinate Latitude': 'mean',
-    'Coordinate Londitude': 'mean'
-}).reset_index()
+# Mean number of train rides and minutes of delay per german station
+# The aggregate store only reads the monthly files that were not ingested before, so this stays cheap
+# when a new month is added
+grouped_delay = AggregateStore().update().mean_table(read_stations())
 
 
 # Assuming you have a Folium map object named 'm'
@@ -599,7 +513,7 @@ grouped_delay = data_delay.groupby('Station or stop').agg({
 # Add non-interactive dots for each train station to the map
 for _, row in grouped_delay.iterrows():
     folium.CircleMarker(
-        location=[row['Coordinate Latitude'], row['Coordinate Londitude']],
+        location=[row['Coordinate Latitude'], row['Coordinate Longitude']],
         radius=3,  # Small radius for dot-like appearance
         color='blue',
         fill=True,
@@ -621,7 +535,11 @@ import pandas as pd
 from shapely.geometry import Point
 from shapely.ops import nearest_points
 import geopandas as gpd
-from tqdm import tqdm
+from reliability import matching, projection
+from reliability.artifacts import cached
+from reliability.data import PATH_DELAYS_CSV, STATION_ROUTES_CSV, get_incidence
+from reliability.chainage import Chainage
+from reliability.matching import nearest_routes
 
 # Assuming continuous_gdf is already a GeoDataFrame with CRS defined
 # If not, convert it and define the CRS (coordinate reference system)
@@ -629,43 +547,20 @@ from tqdm import tqdm
 # continuous_gdf.crs = {'init': 'epsg:4326'}  # or whichever is appropriate
 
 
-def find_nearest_routes_for_stations(routes_gdf, stations_df, distance_threshold=0.01):
-    # Initialize DataFrame to store the station and its corresponding nearest route
-    stations_with_routes = pd.DataFrame(columns=['Station or stop', 'Route', 'Distance'])
-
-    # Iterate over each station with tqdm
-    for _, station in tqdm(stations_df.iterrows(), total=stations_df.shape[0], desc="Processing stations"):
-        station_location = Point(station['Coordinate Londitude'], station['Coordinate Latitude'])
-        nearest_route = None
-        min_dist = float('inf')
-
-        # Iterate over each route to find the nearest one
-        for route_num in routes_gdf['strecke_nr'].unique():
-            route_geometry = routes_gdf[routes_gdf['strecke_nr'] == route_num].iloc[0].geometry
-            nearest_point = nearest_points(station_location, route_geometry)[1]
-            distance = station_location.distance(nearest_point)
-
-            # Update nearest route if this route is closer
-            if distance <= distance_threshold and distance < min_dist:
-                min_dist = distance
-                nearest_route = route_num
+def find_nearest_routes_for_stations(routes_gdf, stations_df, distance_threshold=1000, candidates=1):
+    # The nearest route (or the `candidates` nearest routes) within the threshold for all stations at once:
+    # the stations are queried in bulk against a spatial index over the routes (see reliability.matching)
+    return nearest_routes(routes_gdf, stations_df, distance_threshold=distance_threshold, candidates=candidates)
 
-        # Add the nearest route and its distance to the DataFrame
-        if nearest_route is not None:
-            new_row = pd.DataFrame({
-                'Station or stop': [station['Station or stop']],
-                'Route': [nearest_route],
-                'Distance': [min_dist]
-            })
-            stations_with_routes = pd.concat([stations_with_routes, new_row], ignore_index=True)
+# Call the function with your GeoDataFrame and stations DataFrame (routes in metres, 1 km threshold)
+# The result is cached under a hash of the routes, the stations and the threshold, so it is only
+# recomputed when one of them changes
+stations_with_nearest_routes = cached("stations_with_nearest_routes", find_nearest_routes_for_stations,
+                                      continuous_gdf_m, grouped_delay, distance_threshold=1000,
+                                      depends=(matching, projection))
 
-    return stations_with_routes
-
-# Call the function with your GeoDataFrame and stations DataFrame
-stations_with_nearest_routes = find_nearest_routes_for_stations(continuous_gdf, grouped_delay)
-
-# Save the new dataset
-stations_with_nearest_routes.to_csv('stations_with_nearest_routes.csv', index=False)
+# Save the new dataset (where reliability.data.get_paths and the maps read it)
+stations_with_nearest_routes.to_csv(STATION_ROUTES_CSV, index=False)
 print(stations_with_nearest_routes)
 
 "Match all the station information with this new dataframe of stations and routes"
@@ -678,31 +573,29 @@ print(stations_with_routes_full)
 
 
 "All Paths from Stuttgart to Frankfurt am Main"
-#Here we do the same as before, in that we find all connected routes from Stuttgart to Frankfurt, but we define a full connection as a single direct path
-def build_all_paths(current_route, current_path, target_point, continuous_gdf, all_paths, max_depth=3, depth=0):
-    if depth > max_depth:
-        return
-
-    # Get the endpoint of the current route
-    endpoint = get_furthest_point(continuous_gdf[continuous_gdf['strecke_nr'] == current_route].iloc[0]['geometry'], stuttgart_point)
+# Instead of enumerating all route sequences up to a depth of 3 from route 4801, the most reliable paths
+# are searched over the junction-level graph (stretches of routes between junctions, weighted by the delay
+# of their stations and their length): A* for the best one and Yen's algorithm for the next best ones,
+# so paths over any number of routes are found
+from reliability.data import get_segments
+from reliability.routing import Router
 
-    # Find nearby routes
-    nearby_routes = find_nearby_routes(endpoint, continuous_gdf, current_route, max_routes=10)
+stuttgart_point_m = Point(project(x_stuttgart, y_stuttgart))
+frankfurt_point_m = Point(project(x_frankfurt, y_frankfurt))
 
-    # Check if any of these routes lead directly to Frankfurt am Main
-    for strecke_nr, _, geometry in nearby_routes:
-        new_path = current_path + [strecke_nr]
-        if geometry.intersects(frankfurt_buffer):
-            all_paths.append(new_path)  # Add the path as it leads to Frankfurt am Main
-        else:
-            # Continue building the path if it doesn't lead to Frankfurt am Main yet
-            build_all_paths(strecke_nr, new_path, target_point, continuous_gdf, all_paths, max_depth, depth=depth+1)
+# Number of paths to keep (the notebooks compare the ten best ones)
+N_PATHS = 20
 
-# Initialize the list for all paths
+router = Router(get_segments())
 all_paths = []
-
-# Start building paths from 'strecke 4801'
-build_all_paths(4801, [4801], frankfurt_point, continuous_gdf, all_paths, max_depth=3)
+for path in router.alternatives(stuttgart_point_m, frankfurt_point_m):
+    # alternatives that only take other stretches of the same routes are the same path here
+    if set(path.routes) not in [set(routes) for routes in all_paths]:
+        all_paths.append(path.routes)
+    if len(all_paths) == N_PATHS:
+        break
+if not all_paths:
+    raise ValueError("Stuttgart and Frankfurt am Main are not connected in the route network")
 
 # Now you can visualize the paths as before
 print("All Possible Paths from Stuttgart to Frankfurt am Main: ", all_paths)
@@ -747,29 +640,34 @@ m
 
 
 "Find Total Delays along all Paths from Stuttgart to Frankfurt am Main"
-# Load required datasets
-stations_with_routes_full = pd.read_csv('stations_with_routes_full.csv')
+# Stations at junctions lie on several routes, so every station within 1 km of a route counts for it:
+# a sparse stations x routes matrix (see reliability.incidence), the same persisted matrix get_paths and
+# get_graph score with
+incidence = get_incidence()
+
+# The position (chainage, in metres) of the same stations along their routes (see reliability.chainage)
+chainage = cached("station_chainage", Chainage.build, continuous_gdf_m, grouped_delay, threshold=1000,
+                  depends=(matching, projection))
 
-# Initialize DataFrame to store path delays
-path_delays_df = pd.DataFrame(columns=['Path', 'Total Delay'])
+def find_path_delays(all_paths, incidence, chainage, stations_df):
+    # The average delay of each station
+    individual_delay = (stations_df['Minutes of delay'] / stations_df['Number of train rides']).set_axis(stations_df['Station or stop'])
 
-# Calculate the average delays for each path
-for path_index, path in enumerate(all_paths):
-    total_delay = 0
-    for route in path:
-        # Filter stations for the current route
-        stations_on_route = stations_with_routes_full[stations_with_routes_full['Route'] == route]
+    # Summed over the stations of every route of a path, as one sparse matrix-vector product
+    total_delay = incidence.path_sums(all_paths, individual_delay)
 
-        # Calculate the sum of average delays for each station
-        for _, station in stations_on_route.iterrows():
-            individual_delay = station['Minutes of delay'] / station['Number of train rides']
-            total_delay += individual_delay
+    # Only the stations on the part of each route that the path travels (from Stuttgart, between the
+    # junctions with the previous and next route, to Frankfurt)
+    travelled_delay = chainage.travelled_sums(all_paths, continuous_gdf_m.geometry, individual_delay,
+                                              start=stuttgart_point_m, end=frankfurt_point_m)
+    return pd.DataFrame({'Path': [' -> '.join(map(str, path)) for path in all_paths], 'Total Delay': total_delay,
+                         'Travelled Delay': travelled_delay})
 
-    # Add the total delay of the path to the DataFrame
-    path_delays_df.loc[path_index] = [' -> '.join(map(str, path)), total_delay]
+# The stations and paths come from above (not from csv files of an earlier run)
+path_delays_df = find_path_delays(all_paths, incidence, chainage, grouped_delay)
 
 # Save the DataFrame
-path_delays_df.to_csv('path_delays.csv', index=False)
+path_delays_df.to_csv(PATH_DELAYS_CSV, index=False)
 print(path_delays_df)
 
 
@@ -779,10 +677,7 @@ print(path_delays_df)
 import folium
 import random
 
-# Load the path delays data
-path_delays_df = pd.read_csv('path_delays.csv')
-stations_with_routes_full = pd.read_csv('stations_with_routes_full.csv')
-
+# The path delays and stations computed above
 # Identify the path with the least delay
 least_delay_path = path_delays_df.loc[path_delays_df['Total Delay'].idxmin()]['Path']
 least_delay_path_routes = least_delay_path.split(' -> ')
@@ -818,7 +713,7 @@ for path in all_paths:
 for _, station in stations_with_routes_full.iterrows():
     if station['Route'] in least_delay_path_routes:
         folium.CircleMarker(
-            location=[station['Coordinate Latitude'], station['Coordinate Londitude']],
+            location=[station['Coordinate Latitude'], station['Coordinate Longitude']],
             radius=5,  # Slightly larger for visibility
             color='red',
             fill=True,
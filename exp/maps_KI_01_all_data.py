@@ -14,7 +14,7 @@ from tueplots.constants.color import rgb
 
 
 #### 00 get cleaned data
-from ipynb.fs.full.exp_KI_01_exploration_cleaning import get_data
+from reliability.data import get_data
 data = get_data(which = "mean")
 
 # create geometry column with a point object of the coordinates
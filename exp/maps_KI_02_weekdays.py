@@ -1,4 +1,3 @@
-import pandas as pd
 from shapely.geometry import Point, box
 import geopandas as gpd
 import matplotlib.pyplot as plt
@@ -11,31 +10,19 @@ from matplotlib.backends.backend_pdf import PdfPages
 
 
 #### 00 get cleaned data
-from ipynb.fs.full.exp_KI_01_exploration_cleaning import get_data
-data = get_data()
+from reliability.columnar import read_stations
+from reliability.data import get_cube
+cube = get_cube()
+stations = read_stations()
 
 
 
 #### 01 WEEKDAYS VS WEEKENDS ####
 
-# Turn strings in to pandas date.
-data["Date"] = pd.to_datetime(data["Date"], yearfirst = True)
-
-# Get the day of the week for each date.
-data["dayofweek"] = data["Date"].dt.dayofweek
-
-# filter the data for weekend and weekday
-condition = data["dayofweek"] >= 5
-data_weekend = data[condition]
-data_weekday = data[~condition]
-
-# drop unnecessary columns
-data_weekend = data_weekend.drop(["Date", "dayofweek", "Name", "Country"], axis = 1)
-data_weekday = data_weekday.drop(["Date", "dayofweek", "Name", "Country"], axis = 1)
-
-# get the mean of the minutes of delay for each station
-data_weekend = data_weekend.groupby("Station or stop").mean()
-data_weekday = data_weekday.groupby("Station or stop").mean()
+# get the mean of the minutes of delay for each station on weekends and on weekdays
+# (the station x day cube is only reduced over the days of the slice, nothing is grouped again)
+data_weekend = cube.mean_table(stations, "weekend").set_index("Station or stop")
+data_weekday = cube.mean_table(stations, "weekday").set_index("Station or stop")
 
 # only include rows that are included in both dataframes
 data_weekend = data_weekend[data_weekend.index.isin(data_weekday.index)]
@@ -126,41 +113,14 @@ print(f"Plot saved as {pdf_filename}")
 
 #### 03 ALL WEEKDAYS ####
 
-#### 00 get cleaned data
-data = get_data()
-
-# Turn strings in to pandas date.
-data["Date"] = pd.to_datetime(data["Date"], yearfirst = True)
-
-# Get the day of the week for each date.
-data["dayofweek"] = data["Date"].dt.dayofweek
-
-# create seperate dataframes for every weekday
-data_monday = data[data["dayofweek"] == 0]
-data_tuesday = data[data["dayofweek"] == 1]
-data_wednesday = data[data["dayofweek"] == 2]
-data_thursday = data[data["dayofweek"] == 3]
-data_friday = data[data["dayofweek"] == 4]
-data_saturday = data[data["dayofweek"] == 5]
-data_sunday = data[data["dayofweek"] == 6]
-
-# drop unnecessary columns
-data_monday = data_monday.drop(["Date", "dayofweek", "Name", "Country"], axis = 1)
-data_tuesday = data_tuesday.drop(["Date", "dayofweek", "Name", "Country"], axis = 1)
-data_wednesday = data_wednesday.drop(["Date", "dayofweek", "Name", "Country"], axis = 1)
-data_thursday = data_thursday.drop(["Date", "dayofweek", "Name", "Country"], axis = 1)
-data_friday = data_friday.drop(["Date", "dayofweek", "Name", "Country"], axis = 1)
-data_saturday = data_saturday.drop(["Date", "dayofweek", "Name", "Country"], axis = 1)
-data_sunday = data_sunday.drop(["Date", "dayofweek", "Name", "Country"], axis = 1)
-
-# get the mean of the minutes of delay for each station
-data_monday = data_monday.groupby("Station or stop").mean()
-data_tuesday = data_tuesday.groupby("Station or stop").mean()
-data_wednesday = data_wednesday.groupby("Station or stop").mean()
-data_thursday = data_thursday.groupby("Station or stop").mean()
-data_friday = data_friday.groupby("Station or stop").mean()
-data_saturday = data_saturday.groupby("Station or stop").mean()
-data_sunday = data_sunday.groupby("Station or stop").mean()
+# get the mean of the minutes of delay for each station for every day of the week
+data_monday = cube.mean_table(stations, "monday").set_index("Station or stop")
+data_tuesday = cube.mean_table(stations, "tuesday").set_index("Station or stop")
+data_wednesday = cube.mean_table(stations, "wednesday").set_index("Station or stop")
+data_thursday = cube.mean_table(stations, "thursday").set_index("Station or stop")
+data_friday = cube.mean_table(stations, "friday").set_index("Station or stop")
+data_saturday = cube.mean_table(stations, "saturday").set_index("Station or stop")
+data_sunday = cube.mean_table(stations, "sunday").set_index("Station or stop")
 
 # create geometry with a point object of the coordinates
 geometry_monday = [Point(xy) for xy in zip(data_monday["Coordinate Longitude"], data_monday["Coordinate Latitude"])]
@@ -303,4 +263,33 @@ ax7.legend(loc = "upper left", frameon = False)
 #### Save as PDF
 pdf_filename = "../doc/fig/maps_KI_02_all_weekdays.pdf"
 fig.savefig(pdf_filename, dpi=1000, bbox_inches="tight", pad_inches=0.1, transparent=True)
-print(f"Plot saved as {pdf_filename}")
\ No newline at end of file
+print(f"Plot saved as {pdf_filename}")
+
+
+
+#### 04 MOST RELIABLE ROUTE ON WEEKDAYS VS WEEKENDS ####
+from shapely.geometry import Point
+from reliability.cube import DAYS
+from reliability.data import get_segments
+from reliability.projection import project
+from reliability.routing import SliceRouter
+
+# one router per slice, with the delays of the slice summed onto the segments of the route network
+# (from the same cube as above), so every slice is routed like the mean over all days
+routers = SliceRouter(get_segments(), cube)
+stuttgart_hbf = Point(project(9.18389001053732, 48.78312377049059))
+frankfurt_hbf = Point(project(8.6637837, 50.107288400393465))
+
+# the most reliable path from Stuttgart to Frankfurt for every slice (None if they are not connected,
+# the same for every slice since only the delays differ)
+for which in ["all", "weekday", "weekend"] + DAYS:
+    path = routers.route(stuttgart_hbf, frankfurt_hbf, which)
+    if path is None:
+        raise ValueError("Stuttgart and Frankfurt am Main are not connected in the route network")
+    print("{}: {} (mean delay {:.2f} min)".format(which, path.routes, path.mean_delay))
+
+# is the optimal route the same on weekdays and on weekends?
+weekday_path = routers.route(stuttgart_hbf, frankfurt_hbf, "weekday")
+weekend_path = routers.route(stuttgart_hbf, frankfurt_hbf, "weekend")
+same = weekday_path.routes == weekend_path.routes
+print("The most reliable route is the same on weekdays and weekends: {}".format(same))
@@ -4,7 +4,7 @@ import geopandas as gpd
 import matplotlib.pyplot as plt
 import contextily as cx
 import rasterio
-from shapely.geometry import Point, LineString, box
+from shapely.geometry import LineString, box
 from tueplots import bundles
 from tueplots.constants.color import rgb
 from matplotlib.colors import Normalize
@@ -13,13 +13,16 @@ from matplotlib.colors import LinearSegmentedColormap
 
 
 #### 00 read cleaned data
-from ipynb.fs.full.exp_KI_01_exploration_cleaning import get_data
-from ipynb.fs.full.exp_KI_01_exploration_cleaning import get_paths
+import itertools
+from shapely.geometry import Point
+from reliability.data import get_data, get_network, get_segments, get_stations
+from reliability.projection import project
+from reliability.routing import Router
 
 data = get_data(which="mean")
-path_delays = get_paths()
+stations = get_stations()
 gdf_stations = pd.read_csv("../dat/stations_with_nearest_routes.csv", sep=",")
-data_routes = gpd.read_file("../dat/geo-strecke/strecken_polyline.shp")
+data_routes = get_network().to_geodataframe("feature")
 
 # print("There are {} unique routes we found.".format(len(path_delays)))
 
@@ -28,11 +31,26 @@ data_routes = gpd.read_file("../dat/geo-strecke/strecken_polyline.shp")
 
 #### MOST RELIABLE ROUTE BY US (POINTS) ####
 
-# get the route with the least delay = most reliable route
-paths_sorted = sorted(path_delays.items(), key=lambda x: x[1]["mean_delay"])
-rel_path = paths_sorted[0][1]["routes"]
+# the five most reliable paths from Stuttgart Hbf to Frankfurt(Main)Hbf (in metres), lowest mean delay of
+# their stations first: instead of sorting all enumerated paths, the 20 cheapest paths over the
+# junction-level graph are searched one after the other (their cost is the summed delay of the stations
+# plus a small cost per kilometre, see reliability.routing) and ranked by their mean delay, the metric of
+# the report
+router = Router(get_segments())
+stuttgart_hbf = Point(project(9.18389001053732, 48.78312377049059))
+frankfurt_hbf = Point(project(8.6637837, 50.107288400393465))
+candidates = list(itertools.islice(router.alternatives(stuttgart_hbf, frankfurt_hbf), 20))
+if not candidates:
+    raise ValueError("Stuttgart and Frankfurt am Main are not connected in the route network")
+# paths without any station (NaN mean delay) last
+best_paths = sorted(candidates, key=lambda path: (np.isnan(path.mean_delay), path.mean_delay))[:5]
+for path in best_paths:
+    print(path.routes, path.mean_delay)
+
+# get the route with the lowest mean delay = most reliable route
+rel_path = best_paths[0].routes
 print("The optimal route is: {}".format(rel_path))
-print(paths_sorted[0][1]["mean_delay"])
+print(best_paths[0].mean_delay)
 
 # filter the data for the rel_path
 gdf_stations_rel = gdf_stations[gdf_stations["Route"].isin(rel_path)]
@@ -74,12 +92,45 @@ print("The number of stations included in the fastest route are: {}".format(
 
 
 
+#### TRADE-OFF BETWEEN DISTANCE AND DELAY (PARETO FRONT) ####
+
+# instead of comparing only the most reliable route with the fastest route by DB, compute all paths that
+# no other path beats in track length, summed delay of the stations and number of route changes
+pareto_paths = router.pareto(stuttgart_hbf, frankfurt_hbf)
+pareto_front = pd.DataFrame({"Routes": [path.routes for path in pareto_paths],
+                             "Distance": [path.length / 1000 for path in pareto_paths],
+                             "Delay": [path.delay for path in pareto_paths],
+                             "Mean delay": [path.mean_delay for path in pareto_paths],
+                             "Route changes": [path.changes for path in pareto_paths]})
+print(pareto_front)
+
+# set plotting stylesheet
+plt.rcParams.update(bundles.icml2022(column="half", nrows=1, ncols=1, usetex=False))
+
+# plot distance against delay, colored by the number of route changes
+fig, ax = plt.subplots()
+points = ax.scatter(pareto_front["Distance"], pareto_front["Delay"], c=pareto_front["Route changes"],
+                    cmap="viridis", s=8)
+ax.axhline(gdf_stations_fast["Minutes of delay"].sum(), color="crimson", linewidth=0.8,
+           label="Fastest route (DB)")
+fig.colorbar(points, ax=ax, label="Route changes")
+ax.set_xlabel("Track length [km]")
+ax.set_ylabel("Summed delay of the stations [min]")
+ax.legend(loc="upper right", frameon=False)
+
+# Save as PDF
+pdf_filename = "../doc/fig/other figs/maps_KI_03_pareto_front.pdf"
+fig.savefig(pdf_filename, dpi=1000, bbox_inches="tight", pad_inches=0.1, transparent=True)
+print(f"Plot saved as {pdf_filename}")
+
+
+
+
 #### PLOT THE FASTEST ROUTE ####
 
 #### 01 map of Germany
 # Extract LineString coordinates and create LineString geometries & point geometries
-geometry_points = [Point(xy) for xy in
-                   zip(gdf_stations_fast["Coordinate Longitude"], gdf_stations_fast["Coordinate Latitude"])]
+geometry_points = stations.points(gdf_stations_fast["Station or stop"])
 
 # Create GeoDataFrame
 geo_df_points = gpd.GeoDataFrame(gdf_stations_fast, geometry=geometry_points, crs="EPSG:4326")
@@ -226,8 +277,7 @@ print(f"Plot saved as {pdf_filename}")
 
 #### 01 map of Germany
 # Extract LineString coordinates and create LineString geometries & point geometries
-geometry_points = [Point(xy) for xy in
-                   zip(gdf_stations_rel["Coordinate Longitude"], gdf_stations_rel["Coordinate Latitude"])]
+geometry_points = stations.points(gdf_stations_rel["Station or stop"])
 
 # Create GeoDataFrame
 geo_df_points = gpd.GeoDataFrame(gdf_stations_rel, geometry=geometry_points, crs="EPSG:4326")
@@ -372,9 +422,8 @@ print(f"Plot saved as {pdf_filename}")
 
 #### PLOT THE MOST RELIABLE ROUTE BY OUR MODEL (LINESTRINGS) ####
 
-# get the route with the least delay = most reliable route
-paths_sorted = sorted(path_delays.items(), key=lambda x: x[1]["mean_delay"])
-rel_path = paths_sorted[0][1]["routes"]
+# get the route with the lowest mean delay = most reliable route
+rel_path = best_paths[0].routes
 
 # filter the data for the rel_path
 gdf_stations_rel = gdf_stations[gdf_stations["Route"].isin(rel_path)]
@@ -383,7 +432,7 @@ gdf_stations_rel = gdf_stations[gdf_stations["Route"].isin(rel_path)]
 gdf_stations_rel = gdf_stations_rel.merge(data, on="Station or stop")
 
 # create geometry column with a point object of the coordinates
-geometry = [Point(xy) for xy in zip(gdf_stations_rel["Coordinate Longitude"], gdf_stations_rel["Coordinate Latitude"])]
+geometry = stations.points(gdf_stations_rel["Station or stop"])
 
 # create GeoDataFrame
 geo_df = gpd.GeoDataFrame(gdf_stations_rel, geometry=geometry, crs="EPSG:4326")  # Use the correct CRS
@@ -560,10 +609,8 @@ print(f"Plot saved as {pdf_filename}")
 
 #### 01 map of Germany
 # Extract LineString coordinates and create LineString geometries & point geometries
-geometry_rel = [Point(xy) for xy in
-                zip(gdf_stations_rel["Coordinate Longitude"], gdf_stations_rel["Coordinate Latitude"])]
-geometry_fast = [Point(xy) for xy in
-                 zip(gdf_stations_fast["Coordinate Longitude"], gdf_stations_fast["Coordinate Latitude"])]
+geometry_rel = stations.points(gdf_stations_rel["Station or stop"])
+geometry_fast = stations.points(gdf_stations_fast["Station or stop"])
 
 # Create GeoDataFrame
 geo_df_rel = gpd.GeoDataFrame(gdf_stations_rel, geometry=geometry_rel, crs="EPSG:4326")
@@ -674,10 +721,8 @@ print(f"Plot saved as {pdf_filename}")
 
 #### 01 map of Germany
 # Extract LineString coordinates and create LineString geometries & point geometries
-geometry_rel = [Point(xy) for xy in
-                zip(gdf_stations_rel["Coordinate Longitude"], gdf_stations_rel["Coordinate Latitude"])]
-geometry_fast = [Point(xy) for xy in
-                 zip(gdf_stations_fast["Coordinate Longitude"], gdf_stations_fast["Coordinate Latitude"])]
+geometry_rel = stations.points(gdf_stations_rel["Station or stop"])
+geometry_fast = stations.points(gdf_stations_fast["Station or stop"])
 
 # Create GeoDataFrame
 geo_df_rel = gpd.GeoDataFrame(gdf_stations_rel, geometry=geometry_rel, crs="EPSG:4326")
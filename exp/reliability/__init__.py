@@ -0,0 +1,12 @@
+"""
+Shared data loading and routing helpers for the experiments in ./exp.
+
+The submodules are imported explicitly (e.g. `from reliability.columnar import read_rides`),
+so importing the package itself does not touch any data.
+"""
+
+import os
+
+# directory with the raw data and the directory for everything we derive from it
+DAT_DIR = os.path.normpath(os.path.join(os.path.dirname(__file__), "..", "..", "dat"))
+CACHE_DIR = os.path.join(DAT_DIR, "cache")
@@ -0,0 +1,139 @@
+"""
+Content-addressed cache for derived artifacts (station-route matches, paths, path delays).
+
+An artifact is stored under a key that hashes what it is computed from: the name, the code of the
+function that computes it (bytecode, constants and the names it uses), the source of its module if it
+is part of the `reliability` package, the source of the modules declared in `depends` (e.g.
+`depends=(matching,)` for a script function calling `matching.nearest_routes`), an optional `version`
+and the content of all arguments (DataFrames, geometries, arrays and plain parameters such as the
+distance threshold or `max_depth`). If any of them changes, the key changes and the artifact is
+computed again, otherwise it is loaded from the cache; editing an unrelated module (say a docstring in
+`routing`) keeps it. Older versions of an artifact are removed when a new one is written.
+
+Other functions that `compute` calls (e.g. helpers defined in a script) are not hashed: pass a new
+`version` when changing them.
+"""
+
+import functools
+import glob
+import hashlib
+import json
+import os
+import pickle
+import sys
+
+import numpy as np
+import pandas as pd
+
+from reliability import CACHE_DIR
+
+
+ARTIFACT_DIR = os.path.join(CACHE_DIR, "artifacts")
+
+
+def cached(name, compute, *args, directory=ARTIFACT_DIR, depends=(), version=None, **kwargs):
+    """`compute(*args, **kwargs)`, reused from the cache as long as the code, `version` and arguments are unchanged."""
+    key = artifact_key(name, compute, *args, depends=depends, version=version, **kwargs)
+    path = os.path.join(directory, f"{name}-{key}.pkl")
+    if os.path.exists(path):
+        with open(path, "rb") as f:
+            return pickle.load(f)
+
+    result = compute(*args, **kwargs)
+    os.makedirs(directory, exist_ok=True)
+    with open(path + ".tmp", "wb") as f:
+        pickle.dump(result, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(path + ".tmp", path)
+
+    # drop the versions of this artifact computed from other inputs
+    for stale in glob.glob(os.path.join(directory, glob.escape(name) + "-*.pkl")):
+        if stale != path:
+            os.remove(stale)
+    return result
+
+
+def artifact_key(name, compute, *args, depends=(), version=None, **kwargs):
+    """
+    Hash of the name, the code of `compute`, the source of its module (in the package) and of the
+    modules in `depends`, `version` and the content of all arguments.
+    """
+    h = hashlib.sha256(name.encode())
+    # bound methods and classmethods carry their function in __func__
+    function = getattr(compute, "__func__", compute)
+    code = getattr(function, "__code__", None)
+    if code is not None:
+        h.update(_code_digest(code))
+        h.update(repr((function.__defaults__, function.__kwdefaults__)).encode())
+    # the module of `compute` only if it is in the package (a script would change with every edit)
+    modules = {module.__name__: module for module in depends}
+    module = sys.modules.get(getattr(function, "__module__", None) or "")
+    if module is not None and module.__name__.startswith("reliability."):
+        modules[module.__name__] = module
+    for module_name in sorted(modules):
+        h.update(module_digest(modules[module_name]))
+    h.update(digest(version))
+    for value in args:
+        h.update(digest(value))
+    for key in sorted(kwargs):
+        h.update(key.encode())
+        h.update(digest(kwargs[key]))
+    return h.hexdigest()[:20]
+
+
+def digest(value):
+    """Hash of the content of a value (DataFrames, geometries, arrays and json-like parameters)."""
+    h = hashlib.sha256(type(value).__name__.encode())
+    if isinstance(value, pd.DataFrame):
+        h.update(json.dumps([str(column) for column in value.columns]).encode())
+        h.update(digest(value.index))
+        for column in value.columns:
+            h.update(digest(value[column]))
+    elif isinstance(value, (pd.Series, pd.Index)):
+        if _is_geometry(value):
+            h.update(digest(np.asarray(value)))
+        else:
+            h.update(pd.util.hash_pandas_object(value, index=False).to_numpy().tobytes())
+    elif isinstance(value, np.ndarray) and value.dtype == object:
+        import shapely
+        if len(value) and isinstance(value.flat[0], shapely.Geometry):
+            h.update(b"".join(shapely.to_wkb(value.ravel(), hex=False)))
+        else:
+            h.update(pd.util.hash_array(value.ravel()).tobytes())
+    elif isinstance(value, np.ndarray):
+        h.update(str(value.dtype).encode() + str(value.shape).encode())
+        h.update(np.ascontiguousarray(value).tobytes())
+    elif hasattr(value, "wkb"):
+        # a single shapely geometry
+        h.update(value.wkb)
+    else:
+        h.update(json.dumps(value, sort_keys=True, default=repr).encode())
+    return h.digest()
+
+
+def module_digest(module):
+    """Hash of the name and source of a module."""
+    return _source_digest(module.__name__, module.__file__)
+
+
+@functools.lru_cache(maxsize=None)
+def _source_digest(name, path):
+    h = hashlib.sha256(name.encode())
+    with open(path, "rb") as f:
+        h.update(f.read())
+    return h.digest()
+
+
+def _code_digest(code):
+    # bytecode, the names it uses and its constants, with nested functions (lambdas, comprehensions) in turn
+    h = hashlib.sha256(code.co_code)
+    h.update(json.dumps(code.co_names).encode())
+    for const in code.co_consts:
+        if hasattr(const, "co_code"):
+            h.update(_code_digest(const))
+        else:
+            h.update(type(const).__name__.encode() + repr(const).encode())
+    return h.digest()
+
+
+def _is_geometry(values):
+    return getattr(values.dtype, "name", None) == "geometry"
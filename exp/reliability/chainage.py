@@ -0,0 +1,190 @@
+"""
+Linear referencing of the stations along their routes.
+
+Every station matched to a route gets its chainage: the distance in metres from the start of the route
+to the point of the route closest to the station. The line parts of a route are not always stored in
+the order they are travelled (nor in the same direction), so measuring along the whole MultiLineString
+would jump back and forth. Instead every station is located on its closest part, and the parts of a
+route are chained end to end (each part entered at the end closest to the end of the previous one):
+the chainage is the length of the parts before it in the chain plus the position along the part in the
+direction of travel. The stations of all routes are kept as one array sorted by route and chainage
+with offsets per route, so the stations between two points of a route (e.g. the junctions where a path
+enters and leaves it) are a binary search.
+"""
+
+import numpy as np
+import pandas as pd
+import shapely
+
+from reliability.matching import station_points, within
+
+
+class Chainage:
+    """
+    Stations along every route, sorted by their chainage (in the units of the routes' CRS), with the
+    line part every station lies on and where every part starts in the chain of its route.
+    """
+
+    def __init__(self, strecke_nr, offsets, station_ids, positions, lengths, parts, part_offsets,
+                 part_starts, part_directions):
+        self.strecke_nr = strecke_nr
+        self.offsets = offsets
+        self.station_ids = station_ids
+        self.positions = positions
+        self.lengths = lengths
+        self.parts = parts
+        self.part_offsets = part_offsets
+        self.part_starts = part_starts
+        self.part_directions = part_directions
+
+    @classmethod
+    def build(cls, routes, stations, threshold=1000, snap=50):
+        """
+        Chainage of all stations within `threshold` of a route, for routes in a metric CRS (one
+        geometry per `strecke_nr`, like `RouteNetwork.to_geodataframe("route")`). Parts whose ends are
+        closer than `snap` follow each other in the chain of their route.
+        """
+        routes = routes.iloc[np.argsort(routes["strecke_nr"].to_numpy(), kind="stable")]
+        points = station_points(stations, routes.crs)
+        lines = routes.geometry.to_numpy()
+        # the parts in the order of the routes, like `RouteNetwork.parts`
+        parts, part_routes = shapely.get_parts(lines, return_index=True)
+        part_offsets = np.searchsorted(part_routes, np.arange(len(lines) + 1))
+        part_starts, part_directions = _chain(parts, part_offsets, snap)
+
+        # a station close to several parts of a route lies on the closest of them
+        point, part, distance = within(points, parts, threshold)
+        order = np.lexsort((distance, part_routes[part], point))
+        point, part = point[order], part[order]
+        first = np.ones(len(point), dtype=bool)
+        first[1:] = (point[1:] != point[:-1]) | (part_routes[part][1:] != part_routes[part][:-1])
+        point, part = point[first], part[first]
+        positions = part_starts[part] + part_directions[part] * shapely.line_locate_point(parts[part], points[point])
+
+        # sorted by route and chainage, with the offsets of every route into the sorted arrays
+        line = part_routes[part]
+        order = np.lexsort((positions, line))
+        counts = np.bincount(line, minlength=len(lines))
+        return cls(routes["strecke_nr"].to_numpy(), np.append(0, np.cumsum(counts)),
+                   stations["Station or stop"].to_numpy()[point[order]], positions[order],
+                   shapely.length(lines), part[order], part_offsets, part_starts, part_directions)
+
+    def _route(self, strecke_nr):
+        i = np.searchsorted(self.strecke_nr, strecke_nr)
+        if i == len(self.strecke_nr) or self.strecke_nr[i] != strecke_nr:
+            raise KeyError(strecke_nr)
+        return i
+
+    def on_route(self, strecke_nr):
+        """Station ids and chainages of all stations on a route, in the order along the route."""
+        i = self._route(strecke_nr)
+        window = slice(self.offsets[i], self.offsets[i + 1])
+        return self.station_ids[window], self.positions[window]
+
+    def part_positions(self):
+        """Position of every station along its line part (from the first coordinate of the part)."""
+        return (self.positions - self.part_starts[self.parts]) * self.part_directions[self.parts]
+
+    def locate(self, strecke_nr, geometry, point):
+        """Chainage of the point of a route (its `geometry`, as in `build`) closest to `point`."""
+        i = self._route(strecke_nr)
+        parts = shapely.get_parts(geometry)
+        k = int(np.argmin(shapely.distance(parts, point)))
+        part = self.part_offsets[i] + k
+        return float(self.part_starts[part] + self.part_directions[part] * shapely.line_locate_point(parts[k], point))
+
+    def window(self, strecke_nr, start, end):
+        """Slice into the sorted arrays of the stations between two chainages of a route (in any order)."""
+        i = self._route(strecke_nr)
+        first, last = self.offsets[i], self.offsets[i + 1]
+        low, high = min(start, end), max(start, end)
+        return slice(first + np.searchsorted(self.positions[first:last], low, side="left"),
+                     first + np.searchsorted(self.positions[first:last], high, side="right"))
+
+    def between(self, strecke_nr, start, end):
+        """Ids of the stations between two chainages of a route, in the order along the route."""
+        return self.station_ids[self.window(strecke_nr, start, end)]
+
+    def travelled(self, path, geometries, start=None, end=None):
+        """
+        For every route of a path (a list of `strecke_nr`), the chainages where the path enters and
+        leaves it: at the closest points to the previous and next route, to `start` on the first and
+        to `end` on the last route (or the whole route if they are not given).
+        """
+        lines = [geometries[strecke_nr] for strecke_nr in path]
+        entries = [0.0] * len(path)
+        exits = [float(self.lengths[self._route(strecke_nr)]) for strecke_nr in path]
+        for k in range(len(path) - 1):
+            # the junction of two consecutive routes: the shortest line between them
+            junction = shapely.shortest_line(lines[k], lines[k + 1])
+            a, b = shapely.get_coordinates(junction)
+            exits[k] = self.locate(path[k], lines[k], shapely.Point(a))
+            entries[k + 1] = self.locate(path[k + 1], lines[k + 1], shapely.Point(b))
+        if start is not None:
+            entries[0] = self.locate(path[0], lines[0], start)
+        if end is not None:
+            exits[-1] = self.locate(path[-1], lines[-1], end)
+        return list(zip(path, entries, exits))
+
+    def travelled_sums(self, paths, geometries, values, start=None, end=None):
+        """
+        Sum of the station values (a Series indexed by station id) over only the travelled part of
+        every route of each path (see `travelled`), instead of all stations on the routes.
+        """
+        vector = values.reindex(self.station_ids).fillna(0).to_numpy("float64")
+        # prefix sums, so that every part of a route is a difference of two entries
+        cumulative = np.append(0, np.cumsum(vector))
+        sums = []
+        for path in paths:
+            total = 0.0
+            for strecke_nr, entry, exit in self.travelled(path, geometries, start, end):
+                window = self.window(strecke_nr, entry, exit)
+                total += cumulative[window.stop] - cumulative[window.start]
+            sums.append(total)
+        return np.array(sums)
+
+    def to_frame(self):
+        """One row per station and route: "Station or stop", "Route" and "Chainage"."""
+        counts = np.diff(self.offsets)
+        return pd.DataFrame({"Station or stop": self.station_ids,
+                             "Route": np.repeat(self.strecke_nr, counts),
+                             "Chainage": self.positions})
+
+
+def _chain(parts, part_offsets, snap):
+    # chainage of the first coordinate of every part and the direction it is travelled in (1 along its
+    # coordinates, -1 against them), with the parts of every route chained end to end
+    lengths = shapely.length(parts)
+    ends = np.stack([shapely.get_coordinates(shapely.get_point(parts, 0)),
+                     shapely.get_coordinates(shapely.get_point(parts, -1))], axis=1)
+    starts = np.zeros(len(parts))
+    directions = np.ones(len(parts))
+    for first, last in zip(part_offsets[:-1].tolist(), part_offsets[1:].tolist()):
+        if last - first == 1:
+            continue
+        # distance of every end (part, start or end) to every end of the other parts of the route
+        xy = ends[first:last].reshape(-1, 2)
+        distance = np.hypot(*(xy[:, None] - xy[None]).transpose(2, 0, 1))
+        other = np.repeat(np.arange(last - first), 2)
+        distance[other[:, None] == other[None]] = np.inf
+        free = distance.min(axis=1) >= snap
+
+        remaining = list(range(last - first))
+        offset, tail = 0.0, None
+        while remaining:
+            candidates = [2 * k + side for k in remaining for side in (0, 1)]
+            if tail is not None and distance[tail, candidates].min() < snap:
+                # the part whose end is closest to the end of the chain follows it
+                entry = candidates[int(np.argmin(distance[tail, candidates]))]
+            else:
+                # a new piece of the chain starts at a free end (or at the first remaining part)
+                entry = next((end for end in candidates if free[end]), candidates[0])
+            k, side = divmod(entry, 2)
+            remaining.remove(k)
+            part = first + k
+            # entered at its last coordinate, a part is travelled against its coordinates
+            directions[part] = -1.0 if side else 1.0
+            starts[part] = offset + lengths[part] if side else offset
+            offset += lengths[part]
+            tail = 2 * k + 1 - side
+    return starts, directions
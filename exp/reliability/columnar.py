@@ -0,0 +1,101 @@
+"""
+Typed columnar cache for the semicolon separated csv exports in ./dat.
+
+The first read parses a csv with explicit dtypes and stores every column as a plain numpy array
+in an .npz file in the cache directory. Every later read only loads these arrays again, until the
+csv itself changes (size or modification time).
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+
+from reliability import CACHE_DIR, DAT_DIR
+
+
+RIDES_CSV = os.path.join(DAT_DIR, "Zugfahrten_2016_12.csv")
+STATIONS_CSV = os.path.join(DAT_DIR, "GEO_Bahnstellen_EXPORT.csv")
+
+# english column names (the csv headers are german) and the dtypes we parse them with
+RIDES_DTYPES = {
+    "Station or stop": "int32",
+    "Country": "category",
+    "Date": "category",
+    "Number of train rides": "float32",
+    "Minutes of delay": "float32",
+}
+STATIONS_DTYPES = {
+    "Station or stop": "int32",
+    "Name": "category",
+    "Country": "category",
+    "Coordinate Latitude": "float32",
+    "Coordinate Longitude": "float32",
+}
+
+
+def read_csv_typed(path, dtypes, **kwargs):
+    """Parse one of the DB exports with english column names and explicit dtypes."""
+    return pd.read_csv(path, sep=";", encoding="latin-1", header=0,
+                       names=list(dtypes), dtype=dtypes, **kwargs)
+
+
+def read_cached(path, dtypes, cache_dir=CACHE_DIR):
+    """Read a csv through the columnar cache, (re)building the cache if it is missing or stale."""
+    cache_path = os.path.join(cache_dir, os.path.splitext(os.path.basename(path))[0] + ".npz")
+    stamp = file_stamp(path)
+
+    if os.path.exists(cache_path):
+        with np.load(cache_path, allow_pickle=False) as cached:
+            if cached["__stamp__"].tolist() == stamp and cached["__columns__"].tolist() == list(dtypes):
+                return _from_arrays(cached, dtypes)
+
+    data = read_csv_typed(path, dtypes)
+    _save(cache_path, data, stamp)
+    return data
+
+
+def read_rides(path=RIDES_CSV, cache_dir=CACHE_DIR):
+    """Number of train rides and minutes of delay per station and day."""
+    return read_cached(path, RIDES_DTYPES, cache_dir)
+
+
+def read_stations(path=STATIONS_CSV, cache_dir=CACHE_DIR):
+    """Name, country and coordinates of every station or stop."""
+    return read_cached(path, STATIONS_DTYPES, cache_dir)
+
+
+def file_stamp(path):
+    """Cheap fingerprint (size and modification time) of a source file."""
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def _save(cache_path, data, stamp):
+    arrays = {"__stamp__": np.array(stamp, dtype="int64"),
+              "__columns__": np.array(data.columns, dtype=str)}
+    for i, column in enumerate(data.columns):
+        values = data[column]
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            # categorical columns are stored as integer codes plus the list of categories
+            arrays[f"c{i}"] = values.cat.codes.to_numpy()
+            arrays[f"c{i}_categories"] = np.asarray(values.cat.categories, dtype=str)
+        else:
+            arrays[f"c{i}"] = values.to_numpy()
+
+    # write to a temporary file first, so an interrupted run never leaves a broken cache behind
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+    tmp_path = cache_path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        np.savez(f, **arrays)
+    os.replace(tmp_path, cache_path)
+
+
+def _from_arrays(cached, dtypes):
+    columns = {}
+    for i, (column, dtype) in enumerate(dtypes.items()):
+        if dtype == "category":
+            columns[column] = pd.Categorical.from_codes(cached[f"c{i}"], cached[f"c{i}_categories"])
+        else:
+            columns[column] = cached[f"c{i}"]
+    return pd.DataFrame(columns)
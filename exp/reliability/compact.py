@@ -0,0 +1,156 @@
+"""
+Memory-compact representation of the station-day delay table.
+
+Every row only stores an int32 station code, an int16 day offset and float32 rides and delay
+(14 bytes per row). Names, countries and coordinates are stored once per station, with names and
+countries dictionary-encoded. Grouping by station is a `np.bincount` over the integer codes.
+"""
+
+import numpy as np
+import pandas as pd
+
+from reliability.columnar import read_rides
+from reliability.ingest import DATE, DATE_FORMAT, DELAY, RIDES, STATION
+
+
+# day 0 of the int16 day offsets (covers dates up to 2089)
+EPOCH = np.datetime64("2000-01-01", "D")
+
+
+class StationTable:
+    """Attributes of the stations, one entry per station code."""
+
+    __slots__ = ("ids", "name_codes", "names", "country_codes", "countries", "lat", "lon")
+
+    def __init__(self, ids, name_codes, names, country_codes, countries, lat, lon):
+        self.ids = ids
+        self.name_codes = name_codes
+        self.names = names
+        self.country_codes = country_codes
+        self.countries = countries
+        self.lat = lat
+        self.lon = lon
+
+    @classmethod
+    def from_frame(cls, stations):
+        """Build from the station directory (`read_stations()`), sorted by station id."""
+        stations = stations.drop_duplicates(STATION).sort_values(STATION)
+        name = pd.Categorical(stations["Name"])
+        country = pd.Categorical(stations["Country"])
+        return cls(stations[STATION].to_numpy("int32"),
+                   name.codes.astype("int32"), np.asarray(name.categories, dtype=str),
+                   country.codes.astype("int8"), np.asarray(country.categories, dtype=str),
+                   stations["Coordinate Latitude"].to_numpy("float32"),
+                   stations["Coordinate Longitude"].to_numpy("float32"))
+
+    def __len__(self):
+        return len(self.ids)
+
+    def names_at(self, codes):
+        """Names of the stations with these codes (NaN where a station has no name)."""
+        # a missing name has category code -1, which would index the last name
+        return np.asarray(pd.Categorical.from_codes(self.name_codes[codes], self.names), dtype=object)
+
+    def codes(self, ids):
+        """Station codes of the given ids, -1 for ids that are not in the table."""
+        ids = np.asarray(ids)
+        if not len(self.ids):
+            return np.full(len(ids), -1, dtype="int32")
+        codes = np.searchsorted(self.ids, ids).astype("int32")
+        codes[codes == len(self.ids)] = 0
+        codes[self.ids[codes] != ids] = -1
+        return codes
+
+
+class DelayTable:
+    """Rides and minutes of delay per station and day as flat typed arrays."""
+
+    __slots__ = ("stations", "station", "day", "rides", "delay")
+
+    def __init__(self, stations, station, day, rides, delay):
+        self.stations = stations
+        self.station = station
+        self.day = day
+        self.rides = rides
+        self.delay = delay
+
+    @classmethod
+    def from_chunks(cls, chunks, stations, country="DEUTSCHLAND"):
+        """
+        Build the table from raw chunks (see `ingest.iter_chunks`), with the cleaning of the notebook:
+        only stations of `country` with complete attributes, rows with missing values are dropped.
+        """
+        stations = stations[stations["Country"] == country].dropna()
+        stations = StationTable.from_frame(stations)
+
+        parts = []
+        for chunk in chunks:
+            chunk = chunk.dropna(subset=[STATION, DATE, RIDES, DELAY])
+            codes = stations.codes(chunk[STATION].to_numpy())
+            keep = codes >= 0
+            parts.append((codes[keep], _days(chunk[DATE])[keep],
+                          chunk[RIDES].to_numpy("float32")[keep], chunk[DELAY].to_numpy("float32")[keep]))
+
+        if not parts:
+            parts = [(np.empty(0, "int32"), np.empty(0, "int16"), np.empty(0, "float32"), np.empty(0, "float32"))]
+        return cls(stations, *(np.concatenate(column) for column in zip(*parts)))
+
+    @classmethod
+    def from_files(cls, paths, stations, **kwargs):
+        """Build the table from monthly files, each read through the columnar cache (see `read_rides`)."""
+        if isinstance(paths, str):
+            paths = [paths]
+        return cls.from_chunks((read_rides(path) for path in paths), stations, **kwargs)
+
+    def __len__(self):
+        return len(self.station)
+
+    @property
+    def nbytes(self):
+        rows = self.station.nbytes + self.day.nbytes + self.rides.nbytes + self.delay.nbytes
+        stations = sum(getattr(self.stations, name).nbytes for name in StationTable.__slots__)
+        return rows + stations
+
+    @property
+    def dates(self):
+        return EPOCH + self.day.astype("timedelta64[D]")
+
+    def station_sums(self, mask=None):
+        """Sum of delay and rides and the number of rows per station code (optionally only for `mask`)."""
+        n = len(self.stations)
+        station = self.station if mask is None else self.station[mask]
+        delay = self.delay if mask is None else self.delay[mask]
+        rides = self.rides if mask is None else self.rides[mask]
+        return (np.bincount(station, weights=delay, minlength=n),
+                np.bincount(station, weights=rides, minlength=n),
+                np.bincount(station, minlength=n))
+
+    def station_means(self, mask=None):
+        """Mean number of rides and minutes of delay per station, indexed by station id."""
+        delay, rides, count = self.station_sums(mask)
+        seen = count > 0
+        return pd.DataFrame({RIDES: rides[seen] / count[seen], DELAY: delay[seen] / count[seen]},
+                            index=pd.Index(self.stations.ids[seen], name=STATION))
+
+    def to_frame(self):
+        """Pandas view with the columns of `get_data()` (categorical names and countries)."""
+        stations = self.stations
+        name = pd.Categorical.from_codes(stations.name_codes[self.station], stations.names)
+        country = pd.Categorical.from_codes(stations.country_codes[self.station], stations.countries)
+        return pd.DataFrame({
+            STATION: stations.ids[self.station],
+            DATE: self.dates.astype("datetime64[ns]"),
+            RIDES: self.rides,
+            DELAY: self.delay,
+            "Name": name,
+            "Country": country,
+            "Coordinate Latitude": stations.lat[self.station],
+            "Coordinate Longitude": stations.lon[self.station],
+        })
+
+
+def _days(dates):
+    # parse every distinct date only once (the dates of a chunk are categorical)
+    dates = pd.Categorical(dates)
+    parsed = pd.to_datetime(dates.categories.astype(str), format=DATE_FORMAT).to_numpy("datetime64[D]")
+    return (parsed - EPOCH).astype("int16")[dates.codes]
@@ -0,0 +1,138 @@
+"""
+Station x day cubes of the delay aggregates, memory-mapped from .npy files.
+
+The sums per station-day of the aggregate store are pivoted once into dense arrays (one row per
+station, one column per day): minutes of delay, number of train rides and number of rows. Any
+temporal slice (weekdays, weekends, a day of the week, a month, holidays) is then a boolean mask over
+the day columns, and its means per station are masked reductions that never copy the cube.
+"""
+
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from reliability import CACHE_DIR
+from reliability.ingest import COUNT, DATE, DELAY, RIDES, STATION, join_stations
+
+
+CUBE_DIR = os.path.join(CACHE_DIR, "cube")
+
+DAYS = ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]
+
+
+class DelayCube:
+    """Memory-mapped station x day cubes with the index of their rows (station ids) and columns (dates)."""
+
+    def __init__(self, directory=CUBE_DIR):
+        self.directory = directory
+        self.delay = np.load(os.path.join(directory, "delay.npy"), mmap_mode="r")
+        self.rides = np.load(os.path.join(directory, "rides.npy"), mmap_mode="r")
+        self.count = np.load(os.path.join(directory, "count.npy"), mmap_mode="r")
+        with np.load(os.path.join(directory, "index.npz"), allow_pickle=False) as index:
+            self.station_ids = index["station_ids"]
+            self.dates = index["dates"]
+            self.source = str(index["source"])
+
+    @classmethod
+    def build(cls, daily, directory=CUBE_DIR, source=""):
+        """Pivot sums per station-day (e.g. `AggregateStore().aggregates.daily`) into the cubes."""
+        station = daily.index.get_level_values(STATION).to_numpy("int32")
+        date = daily.index.get_level_values(DATE).to_numpy("datetime64[D]")
+
+        # one row per station, one column per day of the full (contiguous) date range
+        station_ids = np.unique(station)
+        dates = np.arange(date.min(), date.max() + 1) if len(date) else np.empty(0, "datetime64[D]")
+        rows = np.searchsorted(station_ids, station)
+        columns = (date - dates[0]).astype("int64") if len(date) else np.empty(0, "int64")
+
+        os.makedirs(directory, exist_ok=True)
+        shape = (len(station_ids), len(dates))
+        for name, column, dtype in [("delay", DELAY, "float32"), ("rides", RIDES, "float32"),
+                                    ("count", COUNT, "uint16")]:
+            # written through a (zero initialised) memmap, so building does not need the cube in memory either
+            cube = np.lib.format.open_memmap(os.path.join(directory, name + ".npy"), mode="w+",
+                                             dtype=dtype, shape=shape)
+            cube[rows, columns] = daily[column].to_numpy(dtype)
+            cube.flush()
+            del cube
+
+        np.savez(os.path.join(directory, "index.npz"), station_ids=station_ids, dates=dates,
+                 source=np.array(source))
+        return cls(directory)
+
+    @classmethod
+    def from_store(cls, store, directory=CUBE_DIR):
+        """Open the cubes of an aggregate store, rebuilding them if the store changed since."""
+        source = json.dumps(store.manifest, sort_keys=True)
+        if os.path.exists(os.path.join(directory, "index.npz")):
+            cube = cls(directory)
+            if cube.source == source:
+                return cube
+        return cls.build(store.aggregates.daily, directory, source)
+
+    def rows(self, ids):
+        """Row of every station id (-1 if the station is not in the cube)."""
+        ids = np.asarray(ids)
+        if not len(self.station_ids):
+            return np.full(len(ids), -1)
+        rows = np.searchsorted(self.station_ids, ids)
+        rows[rows == len(self.station_ids)] = 0
+        rows[self.station_ids[rows] != ids] = -1
+        return rows
+
+    def mask(self, which="all"):
+        """
+        Boolean mask over the days for a slice: "all", "weekday", "weekend", a day name ("monday") or
+        number (0 = monday), a month ("2016-12"), "holiday" or an explicit boolean array.
+        """
+        if not isinstance(which, (str, int, np.integer)):
+            return np.asarray(which, dtype=bool)
+
+        # numpy counts weekdays from thursday 1970-01-01, shift so that 0 is monday
+        dayofweek = (self.dates.astype("int64") + 3) % 7
+        if isinstance(which, (int, np.integer)):
+            return dayofweek == which
+        elif which == "all":
+            return np.ones(len(self.dates), dtype=bool)
+        elif which == "weekday":
+            return dayofweek < 5
+        elif which == "weekend":
+            return dayofweek >= 5
+        elif which in DAYS:
+            return dayofweek == DAYS.index(which)
+        elif which == "holiday":
+            import holidays
+            years = range(self.dates.min().astype(object).year, self.dates.max().astype(object).year + 1)
+            german_holidays = np.array(sorted(holidays.Germany(years=years)), dtype="datetime64[D]")
+            return np.isin(self.dates, german_holidays)
+        else:
+            # a month like "2016-12"
+            return self.dates.astype("datetime64[M]") == np.datetime64(which, "M")
+
+    def sums(self, which="all"):
+        """Sum of delay, rides and number of rows per station over the days of a slice."""
+        mask = self.mask(which)
+        columns = np.flatnonzero(mask)
+        if len(columns) and columns[-1] - columns[0] + 1 == len(columns):
+            # contiguous slices (months) are plain views
+            window = slice(columns[0], columns[-1] + 1)
+            return (self.delay[:, window].sum(axis=1, dtype="float64"),
+                    self.rides[:, window].sum(axis=1, dtype="float64"),
+                    self.count[:, window].sum(axis=1, dtype="int64"))
+        where = mask[np.newaxis, :]
+        return (self.delay.sum(axis=1, dtype="float64", where=where),
+                self.rides.sum(axis=1, dtype="float64", where=where),
+                self.count.sum(axis=1, dtype="int64", where=where))
+
+    def station_means(self, which="all"):
+        """Mean number of rides and minutes of delay per station id over a slice."""
+        delay, rides, count = self.sums(which)
+        seen = count > 0
+        return pd.DataFrame({RIDES: rides[seen] / count[seen], DELAY: delay[seen] / count[seen]},
+                            index=pd.Index(self.station_ids[seen], name=STATION))
+
+    def mean_table(self, stations, which="all", country="DEUTSCHLAND"):
+        """Like `ingest.mean_table`, but only over the days of a slice."""
+        return join_stations(self.station_means(which), stations, country)
@@ -0,0 +1,204 @@
+"""
+Cleaned delay data and the scored paths, as used by all scripts in ./exp.
+
+This replaces importing `get_data` and `get_paths` from the cleaning notebook via `ipynb.fs.full`,
+which executed the whole notebook (including its plots) on import. Nothing is loaded when this module
+is imported; every table is built on the first call that needs it and reused afterwards.
+"""
+
+import functools
+import os
+
+from reliability import DAT_DIR
+
+
+PATH_DELAYS_CSV = os.path.join(DAT_DIR, "path_delays.csv")
+STATION_ROUTES_CSV = os.path.join(DAT_DIR, "stations_with_nearest_routes.csv")
+
+COUNTRY = "DEUTSCHLAND"
+MIN_RIDES = 10
+
+
+def get_data(which="full"):
+    """
+    Cleaned delay data of the german stations.
+
+    which="full" returns one row per station and day, which="mean" one row per station with the mean
+    number of train rides and minutes of delay (only stations with at least 10 rides in mean).
+    """
+    if which == "full":
+        return _full()
+    elif which == "mean":
+        return _mean()
+    else:
+        print("Choose full or mean dataset.")
+
+
+def get_stations():
+    """Station directory (see `stations.StationDirectory`) for O(1) and vectorized lookups by station id."""
+    return _directory()
+
+
+def get_table():
+    """The full data as a memory-compact `compact.DelayTable` (integer codes and float32 columns)."""
+    return _table()
+
+
+def get_cube():
+    """Memory-mapped station x day cubes (see `cube.DelayCube`) for means over temporal slices."""
+    return _cube()
+
+
+def get_network(metric=False):
+    """
+    Lines of all routes from the binary cache of strecken_polyline.shp (see `network.RouteNetwork`),
+    in longitude and latitude or with metric=True projected into the metric CRS (in metres).
+    """
+    return _network(metric)
+
+
+def get_hubs():
+    """Stations and route endpoints clustered into named hubs (see `hubs.Hubs`), e.g. the routes at a station."""
+    return _hubs()
+
+
+def get_incidence():
+    """
+    All stations within 1 km of every route as a sparse stations x routes matrix (see
+    `incidence.Incidence`), so stations at junctions count for each of their routes. Persisted in the
+    artifact cache and shared by the path scores, the route graph and exp_SBS_02.
+    """
+    return _incidence()
+
+
+def get_graph():
+    """
+    Graph of the connected routes as memory-mapped CSR arrays (see `graph.RouteGraph`), weighted by
+    the length of the routes and the delay of their stations.
+    """
+    return _graph()
+
+
+def get_segments():
+    """
+    Junction-level graph of the routes (see `segments.SegmentGraph`), with the length and the delay of
+    the stations along every stretch of a route between two junctions.
+    """
+    return _segments()
+
+
+def get_paths():
+    """Paths from Stuttgart to Frankfurt with their routes, stations and mean delay."""
+    return _paths()
+
+
+@functools.lru_cache(maxsize=None)
+def _stations():
+    from reliability.columnar import read_stations
+    return read_stations()
+
+
+@functools.lru_cache(maxsize=None)
+def _directory():
+    from reliability.stations import StationDirectory
+    return StationDirectory.load()
+
+
+@functools.lru_cache(maxsize=None)
+def _table():
+    from reliability.compact import DelayTable
+    from reliability.ingest import monthly_files
+
+    # rides of all months, only german stations without missing values (see compact.DelayTable)
+    return DelayTable.from_files(monthly_files(), _stations(), country=COUNTRY)
+
+
+@functools.lru_cache(maxsize=None)
+def _full():
+    return _table().to_frame()
+
+
+@functools.lru_cache(maxsize=None)
+def _store():
+    from reliability.store import AggregateStore
+    return AggregateStore().update()
+
+
+@functools.lru_cache(maxsize=None)
+def _cube():
+    from reliability.cube import DelayCube
+    return DelayCube.from_store(_store())
+
+
+@functools.lru_cache(maxsize=None)
+def _mean():
+    # the means come from the aggregate store, so the raw rows are never loaded for them
+    data_mean = _store().mean_table(_stations())
+    return data_mean[data_mean["Number of train rides"] >= MIN_RIDES]
+
+
+@functools.lru_cache(maxsize=None)
+def _network(metric):
+    from reliability.network import RouteNetwork
+    from reliability.projection import METRIC_CRS
+    return RouteNetwork.load(crs=METRIC_CRS if metric else None)
+
+
+@functools.lru_cache(maxsize=None)
+def _hubs():
+    from reliability.hubs import Hubs
+    return Hubs.build(_directory(), _network(True))
+
+
+@functools.lru_cache(maxsize=None)
+def _incidence():
+    from reliability import matching, projection
+    from reliability.artifacts import cached
+    from reliability.incidence import Incidence
+
+    # the same inputs as in exp_SBS_02 (all stations with their mean delay), so both share one artifact
+    stations = _store().mean_table(_stations())
+    return cached("station_routes", Incidence.build, _network(True).to_geodataframe("route"), stations,
+                  threshold=1000, depends=(matching, projection))
+
+
+@functools.lru_cache(maxsize=None)
+def _graph():
+    from reliability.graph import RouteGraph
+
+    delays = _incidence().route_sums(_mean().set_index("Station or stop")["Minutes of delay"])
+    return RouteGraph.load(_network(True), delays)
+
+
+@functools.lru_cache(maxsize=None)
+def _segments():
+    from reliability.chainage import Chainage
+    from reliability.segments import SegmentGraph
+
+    network = _network(True)
+    chainage = Chainage.build(network.to_geodataframe("route"), _mean(), threshold=1000)
+    return SegmentGraph.build(network, chainage, _mean())
+
+
+@functools.lru_cache(maxsize=None)
+def _paths():
+    import pandas as pd
+
+    paths = pd.read_csv(PATH_DELAYS_CSV)
+    incidence = _incidence()
+    delay = _mean().set_index("Station or stop")["Minutes of delay"]
+
+    # stations and mean delay of all paths at once, as products with the station x route incidence
+    routes = [list(map(int, path.split(" -> "))) for path in paths["Path"]]
+    stations = incidence.stations_of(routes)
+    means = incidence.path_means(routes, delay)
+    paths_dict = {}
+    for index, (routes_of_path, stations_for_routes, mean) in enumerate(zip(routes, stations, means)):
+        paths_dict[f"path{index}"] = {"routes": routes_of_path, "stations": stations_for_routes.tolist(),
+                                      "mean_delay": mean}
+
+    # only retain paths that do not use the same stations
+    unique_stations = {}
+    for value in paths_dict.values():
+        unique_stations.setdefault(tuple(value["stations"]), value)
+    return {f"path{i}": value for i, value in enumerate(unique_stations.values())}
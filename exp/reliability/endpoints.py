@@ -0,0 +1,75 @@
+"""
+Endpoint table and spatial indexes of the route network.
+
+The start and end point of every line part of every route are taken once from the flat coordinate
+arrays of `network.RouteNetwork` (two rows per part, grouped by route), with a KD-tree over them. The
+routes themselves are indexed by an STRtree. The furthest endpoint of a route is then an argmax over
+its few rows, and the routes near a point are found through the indexes instead of computing the
+distance to every route.
+"""
+
+import numpy as np
+import shapely
+from scipy.spatial import cKDTree
+
+
+class RouteEndpoints:
+    """Endpoints of all line parts of the routes of a network, indexed by a KD-tree and an STRtree."""
+
+    def __init__(self, network):
+        # start and end of every part, interleaved, so the endpoints of a route are one slice
+        first = network.part_offsets[:-1]
+        last = network.part_offsets[1:] - 1
+        self.xy = network.coords[np.column_stack([first, last]).ravel(), :2]
+        self.route = np.repeat(network.part_routes, 2)
+        self.offsets = 2 * network.feature_offsets[network.route_offsets]
+
+        self.strecke_nr = network.strecke_nr
+        self.index = network.index
+        self.lines = network.geometries
+        self.tree = cKDTree(self.xy)
+        self.line_tree = shapely.STRtree(self.lines)
+
+        # first radius of the nearest route search: about the spacing of the routes
+        (xmin, ymin), (xmax, ymax) = self.xy.min(axis=0), self.xy.max(axis=0)
+        self.center = shapely.Point((xmin + xmax) / 2, (ymin + ymax) / 2)
+        self.extent = float(np.hypot(xmax - xmin, ymax - ymin))
+        self.radius = self.extent / max(np.sqrt(len(self.lines)), 1)
+
+    def of_route(self, strecke_nr):
+        """Coordinates of the endpoints of all parts of a route (start and end of each part in turn)."""
+        i = self.index[strecke_nr]
+        return self.xy[self.offsets[i]:self.offsets[i + 1]]
+
+    def furthest(self, strecke_nr, reference):
+        """The endpoint of a route furthest from a reference point (the first one if several are)."""
+        xy = self.of_route(strecke_nr)
+        distance = np.hypot(xy[:, 0] - reference.x, xy[:, 1] - reference.y)
+        return shapely.Point(xy[np.argmax(distance)])
+
+    def routes_near(self, point, radius):
+        """Routes with an endpoint within `radius` of a point (sorted by `strecke_nr`)."""
+        rows = self.tree.query_ball_point((point.x, point.y), radius)
+        return self.strecke_nr[np.unique(self.route[rows])]
+
+    def nearest(self, point, k=1, exclude=None):
+        """
+        The `k` routes closest to a point as (strecke_nr, distance) pairs, nearest first and ties in
+        the order of the routes, optionally without the route `exclude`.
+        """
+        excluded = self.index.get(exclude, -1)
+        wanted = min(k, len(self.lines) - (excluded >= 0))
+        # all routes are within this distance of the point
+        limit = self.extent + point.distance(self.center)
+        radius = self.radius
+        while True:
+            # every route closer than the k-th candidate within the radius is within the radius too
+            candidates = self.line_tree.query(point, predicate="dwithin", distance=radius)
+            candidates = candidates[candidates != excluded]
+            if len(candidates) >= wanted or radius > limit:
+                break
+            radius *= 4
+
+        distance = shapely.distance(point, self.lines[candidates])
+        order = np.lexsort((candidates, distance))[:k]
+        return [(self.strecke_nr[i], float(distance[j])) for j, i in zip(order, candidates[order])]
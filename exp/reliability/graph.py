@@ -0,0 +1,177 @@
+"""
+Route graph as compact CSR arrays on disk.
+
+The graph of connected routes (see `topology.RouteTopology`) is stored as arrays: for every route
+(node, in the order of the sorted `strecke_nr`) the offsets `indptr` into the neighbouring routes
+`indices`, with two weights per edge: the length in metres and the delay (sum of the mean minutes of
+delay of the stations) of the route entered. Every array is one .npy file in a directory, memory-mapped
+on load (the arrays inside an .npz are zipped and cannot be mapped), so routing can start without
+building the graph or holding a Python object per node and edge. A networkx view is built on request.
+
+When the network changes, the graph is patched instead of rebuilt: the routes are compared with the
+cached ones by `strecke_nr` and the hash of their lines, the connections between unchanged routes are
+kept and only the connections of added or changed routes are searched (see `RouteTopology.build`).
+"""
+
+import functools
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+import shapely
+
+from reliability import CACHE_DIR, topology
+from reliability.artifacts import artifact_key
+from reliability.topology import RouteTopology
+
+
+GRAPH_DIR = os.path.join(CACHE_DIR, "route_graph")
+ARRAYS = ("indptr", "indices", "length", "delay", "xy", "strecke_nr", "hashes")
+
+
+class RouteGraph:
+    """Directed CSR graph of the routes; edge weights are the length and delay of the target route."""
+
+    def __init__(self, indptr, indices, length, delay, xy, strecke_nr, hashes, key=None, threshold=None):
+        self.indptr = indptr
+        self.indices = indices
+        self.length = length
+        self.delay = delay
+        self.xy = xy
+        self.strecke_nr = strecke_nr
+        self.hashes = hashes
+        self.key = key
+        self.threshold = threshold
+
+    @classmethod
+    def build(cls, topology, lengths, delays, hashes):
+        """
+        Graph of the connections of a topology in both directions, with the `lengths` and `delays` of
+        the routes (arrays in the order of `topology.strecke_nr`) as the weights of the edges into them.
+        """
+        return cls._from_edges(topology.strecke_nr, topology.source, topology.target, topology.xy,
+                               lengths, delays, hashes)
+
+    @classmethod
+    def load(cls, network, delays=None, directory=GRAPH_DIR, threshold=50):
+        """
+        The graph of a network in a metric CRS with the route delays (a Series indexed by `strecke_nr`,
+        0 where missing), memory-mapped from `directory`. If the network or the delays changed, the
+        cached graph is updated (see `update`) or, for another threshold, built again.
+        """
+        key = artifact_key("route_graph", cls.build, network.stamp, network.crs, delays, threshold=threshold,
+                           depends=(topology,))
+        graph = None
+        if os.path.exists(os.path.join(directory, "key.npy")):
+            graph = cls.read(directory)
+            if graph.key == key:
+                return graph
+
+        if graph is not None and graph.threshold == threshold:
+            graph = graph.update(network, delays)
+        else:
+            connections = RouteTopology.build(network, threshold)
+            graph = cls.build(connections, *_weights(network, delays), network.hashes)
+        graph.key = key
+        graph.threshold = threshold
+        graph.write(directory)
+        return cls.read(directory)
+
+    def update(self, network, delays=None):
+        """
+        The graph of a changed network: the connections between routes whose lines did not change are
+        kept, the connections of added and changed routes are searched again.
+        """
+        old = pd.Series(np.asarray(self.hashes), index=np.asarray(self.strecke_nr))
+        new = pd.Series(network.hashes, index=network.strecke_nr)
+        unchanged = new.index[old.reindex(new.index).to_numpy() == new.to_numpy()]
+
+        # connections between unchanged routes, each once, at the positions of the new network
+        source = np.repeat(np.arange(len(self)), np.diff(self.indptr))
+        target = np.asarray(self.indices)
+        kept_routes = np.isin(self.strecke_nr, unchanged)
+        keep = (source < target) & kept_routes[source] & kept_routes[target]
+        source = np.searchsorted(network.strecke_nr, self.strecke_nr[source[keep]])
+        target = np.searchsorted(network.strecke_nr, self.strecke_nr[target[keep]])
+
+        changed = np.flatnonzero(~np.isin(network.strecke_nr, unchanged))
+        topology = RouteTopology.build(network, self.threshold, routes=changed)
+        return self._from_edges(network.strecke_nr, np.concatenate([source, topology.source]),
+                                np.concatenate([target, topology.target]),
+                                np.concatenate([np.asarray(self.xy)[keep], topology.xy]),
+                                *_weights(network, delays), network.hashes, threshold=self.threshold)
+
+    @classmethod
+    def _from_edges(cls, strecke_nr, source, target, xy, lengths, delays, hashes, threshold=None):
+        # every connection in both directions, sorted by source and target
+        source, target = np.concatenate([source, target]), np.concatenate([target, source])
+        xy = np.concatenate([xy, xy])
+        order = np.lexsort((target, source))
+        # routes with several contacts are connected once, at the first (closest) one (the sort is stable)
+        first = np.ones(len(order), dtype=bool)
+        first[1:] = (np.diff(source[order]) != 0) | (np.diff(target[order]) != 0)
+        order = order[first]
+        source, target = source[order], target[order]
+        indptr = np.append(0, np.cumsum(np.bincount(source, minlength=len(strecke_nr))))
+        return cls(indptr, target, np.asarray(lengths, dtype="float64")[target],
+                   np.asarray(delays, dtype="float64")[target], xy[order], strecke_nr, hashes,
+                   threshold=threshold)
+
+    @classmethod
+    def read(cls, directory, mmap=True):
+        arrays = {name: np.load(os.path.join(directory, name + ".npy"), mmap_mode="r" if mmap else None,
+                                allow_pickle=False) for name in ARRAYS}
+        key = str(np.load(os.path.join(directory, "key.npy"), allow_pickle=False))
+        threshold = float(np.load(os.path.join(directory, "threshold.npy"), allow_pickle=False))
+        return cls(**arrays, key=key, threshold=threshold)
+
+    def write(self, directory):
+        # all arrays are written next to the graph and swapped in at once
+        tmp = directory + ".tmp"
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.makedirs(tmp)
+        for name in ARRAYS:
+            np.save(os.path.join(tmp, name + ".npy"), np.ascontiguousarray(getattr(self, name)))
+        np.save(os.path.join(tmp, "key.npy"), np.array(self.key or ""))
+        np.save(os.path.join(tmp, "threshold.npy"), np.array(self.threshold, dtype="float64"))
+        shutil.rmtree(directory, ignore_errors=True)
+        os.replace(tmp, directory)
+
+    def __len__(self):
+        return len(self.strecke_nr)
+
+    @functools.cached_property
+    def index(self):
+        """Position of every `strecke_nr` in the node arrays."""
+        return dict(zip(self.strecke_nr.tolist(), range(len(self.strecke_nr))))
+
+    def neighbours(self, strecke_nr):
+        """`strecke_nr` of the routes connected to a route."""
+        i = self.index[strecke_nr]
+        return self.strecke_nr[self.indices[self.indptr[i]:self.indptr[i + 1]]]
+
+    def matrix(self, weight="length"):
+        """The graph as a scipy CSR matrix with the "length" or "delay" of the edges (e.g. for csgraph)."""
+        return sp.csr_matrix((getattr(self, weight), self.indices, self.indptr), shape=(len(self), len(self)))
+
+    def to_networkx(self):
+        """Directed networkx graph (nodes are `strecke_nr`) with "length", "delay" and "xy" on the edges."""
+        import networkx as nx
+        graph = nx.DiGraph()
+        graph.add_nodes_from(self.strecke_nr.tolist())
+        source = np.repeat(self.strecke_nr, np.diff(self.indptr)).tolist()
+        target = self.strecke_nr[self.indices].tolist()
+        graph.add_edges_from((a, b, {"length": length, "delay": delay, "xy": xy}) for a, b, length, delay, xy in
+                             zip(source, target, self.length.tolist(), self.delay.tolist(),
+                                 map(tuple, self.xy.tolist())))
+        return graph
+
+
+def _weights(network, delays):
+    # length of every route and the sum of the delays of its stations (0 without delays)
+    lengths = shapely.length(network.geometries)
+    if delays is None:
+        return lengths, np.zeros(len(network))
+    return lengths, delays.reindex(network.strecke_nr, fill_value=0).fillna(0).to_numpy("float64")
@@ -0,0 +1,109 @@
+"""
+Hubs: clusters of stations and route endpoints, looked up by station name.
+
+Instead of buffering hard-coded coordinates and intersecting the buffer with every route, all stations
+and route endpoints (projected into metres) are clustered once: points closer than a radius end up in
+the same hub (single linkage through a KD-tree). Every hub knows its stations and the routes touching
+it (routes ending in the hub or passing within the radius of one of its stations), so "routes at
+STUTTGART HBF" or "routes into FRANKFURT (MAIN)" are dictionary lookups. Names are compared without
+regard to case (GEO_Bahnstellen spells them in upper case).
+"""
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+from scipy.sparse.csgraph import connected_components
+from scipy.spatial import cKDTree
+
+from reliability.endpoints import RouteEndpoints
+from reliability.matching import within
+
+
+class Hubs:
+    """Named hubs with their stations and routes."""
+
+    def __init__(self, names, x, y, stations, routes, by_name):
+        self.names = names
+        self.x = x
+        self.y = y
+        self.stations = stations
+        self.routes = routes
+        self.by_name = by_name
+
+    @classmethod
+    def build(cls, directory, network, radius=1000):
+        """
+        Cluster the stations of a `StationDirectory` and the route endpoints of a network in a metric CRS
+        (`RouteNetwork.load(crs=METRIC_CRS)`), joining all points closer than `radius` metres.
+        """
+        x, y = directory.xy
+        located = np.flatnonzero(np.isfinite(x) & np.isfinite(y))
+        endpoints = RouteEndpoints(network)
+        points = np.concatenate([np.column_stack([x[located], y[located]]), endpoints.xy])
+
+        # clusters are the connected components of the graph of all pairs closer than the radius
+        pairs = cKDTree(points).query_pairs(radius, output_type="ndarray")
+        graph = sp.coo_matrix((np.ones(len(pairs)), (pairs[:, 0], pairs[:, 1])), shape=(len(points),) * 2)
+        count, labels = connected_components(graph, directed=False)
+
+        # only clusters with a station are hubs (endpoints far from any station get -1)
+        hub_labels = np.unique(labels[:len(located)])
+        hub_of_label = np.full(count, -1)
+        hub_of_label[hub_labels] = np.arange(len(hub_labels))
+        station_hubs = hub_of_label[labels[:len(located)]]
+        endpoint_hubs = hub_of_label[labels[len(located):]]
+
+        # routes ending in a hub and routes passing close to one of its stations
+        station_rows, lines, _ = within(directory.points(directory.ids[located], projected=True),
+                                        endpoints.lines, radius)
+        ending = endpoint_hubs >= 0
+        touching = pd.DataFrame({"hub": np.concatenate([endpoint_hubs[ending], station_hubs[station_rows]]),
+                                 "route": np.concatenate([endpoints.route[ending], lines])}).drop_duplicates()
+        routes = {hub: network.strecke_nr[np.sort(group.to_numpy())]
+                  for hub, group in touching.groupby("hub")["route"]}
+
+        names = directory.names_at(located)
+        stations = pd.Series(directory.ids[located]).groupby(station_hubs)
+        members = pd.Series(np.arange(len(located))).groupby(station_hubs)
+        return cls(np.array([_hub_name(names[rows]) for _, rows in members]),
+                   pd.Series(x[located]).groupby(station_hubs).mean().to_numpy(),
+                   pd.Series(y[located]).groupby(station_hubs).mean().to_numpy(),
+                   {hub: ids.to_numpy() for hub, ids in stations},
+                   routes,
+                   {name.casefold(): hub for name, hub in zip(names.tolist(), station_hubs.tolist())
+                    if isinstance(name, str)})
+
+    def __len__(self):
+        return len(self.names)
+
+    def __getitem__(self, name):
+        """Hub of the station with this name (in any case)."""
+        return self.by_name[name.casefold()]
+
+    def routes_of(self, name):
+        """`strecke_nr` of all routes touching the hub of a station."""
+        return self.routes.get(self[name], np.empty(0, dtype="int64"))
+
+    def stations_of(self, name):
+        """Ids of all stations in the hub of a station."""
+        return self.stations[self[name]]
+
+    def city(self, prefix):
+        """Hubs of all stations whose name starts with `prefix` (e.g. "FRANKFURT (MAIN)" for Frankfurt am Main)."""
+        hubs = sorted({hub for name, hub in self.by_name.items() if name.startswith(prefix.casefold())})
+        if not hubs:
+            raise KeyError(f"no station name starts with {prefix!r}")
+        return hubs
+
+    def city_routes(self, prefix):
+        """`strecke_nr` of all routes touching any hub of a city."""
+        routes = [self.routes[hub] for hub in self.city(prefix) if hub in self.routes]
+        return np.unique(np.concatenate(routes)) if routes else np.empty(0, dtype="int64")
+
+
+def _hub_name(names):
+    # a main station names its hub, otherwise the shortest station name does; stations without a name (NaN)
+    # never do
+    names = [name for name in names if isinstance(name, str)]
+    main = [name for name in names if name.casefold().endswith("hbf")]
+    return min(main or names, key=len) if names else ""
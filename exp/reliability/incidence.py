@@ -0,0 +1,100 @@
+"""
+Sparse incidence of stations and routes.
+
+Stations at junctions lie on several routes, so instead of one route per station the matching is kept
+as a CSR matrix with one row per station and one column per route (`strecke_nr`). Aggregates per
+route and scores per path are then sparse matrix-vector products with a vector of station values
+(e.g. the mean minutes of delay), without filtering a DataFrame for every route.
+"""
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+
+from reliability.matching import stations_within
+
+
+class Incidence:
+    """Stations (rows) x routes (columns), 1 where a station lies on a route."""
+
+    def __init__(self, matrix, station_ids, strecke_nr):
+        self.matrix = matrix.tocsr()
+        self.station_ids = station_ids
+        self.strecke_nr = strecke_nr
+
+    @classmethod
+    def from_matches(cls, matches):
+        """Build from matches with "Station or stop" and "Route" columns (one row per station and route)."""
+        # rows in the order the stations first appear, columns sorted by route
+        station_ids = pd.unique(matches["Station or stop"].to_numpy())
+        strecke_nr = np.unique(matches["Route"].to_numpy())
+        rows = pd.Index(station_ids).get_indexer(matches["Station or stop"].to_numpy())
+        columns = np.searchsorted(strecke_nr, matches["Route"].to_numpy())
+        matrix = sp.csr_matrix((np.ones(len(matches)), (rows, columns)),
+                               shape=(len(station_ids), len(strecke_nr)))
+        # a station matched to several lines of the same route is still on it once
+        matrix.data[:] = 1
+        return cls(matrix, station_ids, strecke_nr)
+
+    @classmethod
+    def build(cls, routes, stations, threshold=1000):
+        """All stations within `threshold` of each route (see `matching.stations_within`)."""
+        return cls.from_matches(stations_within(stations, routes, threshold))
+
+    @property
+    def shape(self):
+        return self.matrix.shape
+
+    def station_vector(self, values):
+        """Values indexed by station id (a Series) as a vector over the rows, NaN for missing stations."""
+        return values.reindex(self.station_ids).to_numpy("float64")
+
+    def route_sums(self, values):
+        """Sum of the station values on every route (missing values count as 0)."""
+        vector = np.nan_to_num(self.station_vector(values))
+        return pd.Series(self.matrix.T @ vector, index=pd.Index(self.strecke_nr, name="Route"))
+
+    def route_means(self, values):
+        """Mean of the station values on every route, over the stations with a value."""
+        vector = self.station_vector(values)
+        seen = ~np.isnan(vector)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            means = (self.matrix.T @ np.where(seen, vector, 0)) / (self.matrix.T @ seen.astype("float64"))
+        return pd.Series(means, index=pd.Index(self.strecke_nr, name="Route"))
+
+    def paths(self, paths):
+        """Paths (lists of `strecke_nr`) x routes, counting how often a path uses a route."""
+        rows, routes = [], []
+        for i, path in enumerate(paths):
+            rows.extend([i] * len(path))
+            routes.extend(path)
+        columns = pd.Index(self.strecke_nr).get_indexer(routes)
+        # routes without any station do not contribute
+        known = columns >= 0
+        return sp.csr_matrix((np.ones(known.sum()), (np.asarray(rows, dtype="int64")[known], columns[known])),
+                             shape=(len(paths), len(self.strecke_nr)))
+
+    def path_stations(self, paths):
+        """Paths x stations, 1 where a station lies on any route of the path."""
+        matrix = (self.paths(paths) @ self.matrix.T).tocsr()
+        matrix.data[:] = 1
+        matrix.sort_indices()
+        return matrix
+
+    def path_sums(self, paths, values):
+        """Sum over the routes of every path of the station values on them (a station counts once per route)."""
+        return self.paths(paths) @ self.route_sums(values).to_numpy()
+
+    def path_means(self, paths, values):
+        """Mean of the values of all distinct stations on the routes of every path."""
+        vector = self.station_vector(values)
+        seen = ~np.isnan(vector)
+        stations = self.path_stations(paths)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return (stations @ np.where(seen, vector, 0)) / (stations @ seen.astype("float64"))
+
+    def stations_of(self, paths):
+        """Ids of the stations on the routes of every path (in row order)."""
+        stations = self.path_stations(paths)
+        return [self.station_ids[stations.indices[stations.indptr[i]:stations.indptr[i + 1]]]
+                for i in range(stations.shape[0])]
@@ -0,0 +1,181 @@
+"""
+Streaming ingest of the monthly Zugfahrten exports.
+
+The files are read in chunks and every chunk is folded into running sums and counts per station
+and per station and day, so memory only depends on the number of stations and days and never on
+the number of raw rows.
+"""
+
+import glob
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from reliability import DAT_DIR
+from reliability.columnar import RIDES_DTYPES, read_csv_typed
+
+
+STATION = "Station or stop"
+DATE = "Date"
+RIDES = "Number of train rides"
+DELAY = "Minutes of delay"
+COUNT = "Count"
+
+# the raw dates are day first, e.g. "16.03.2016 00:00"
+DATE_FORMAT = "%d.%m.%Y %H:%M"
+
+CHUNKSIZE = 1_000_000
+
+
+def monthly_files(dat_dir=DAT_DIR, pattern="Zugfahrten_*.csv"):
+    """All monthly exports in the data directory, sorted by name (i.e. by month)."""
+    return sorted(glob.glob(os.path.join(dat_dir, pattern)))
+
+
+def iter_chunks(paths, chunksize=CHUNKSIZE):
+    """Yield typed chunks of at most `chunksize` rows from any number of monthly files."""
+    if isinstance(paths, str):
+        paths = [paths]
+    for path in paths:
+        with read_csv_typed(path, RIDES_DTYPES, chunksize=chunksize) as reader:
+            yield from reader
+
+
+class Aggregates:
+    """Running sums of delay and rides plus the number of rows, per station and per station-day."""
+
+    # consolidate the per-chunk daily sums once this many of them have piled up
+    max_pending = 16
+
+    def __init__(self):
+        self.stations = _empty([STATION])
+        self._daily = [_empty([STATION, DATE])]
+
+    @classmethod
+    def from_daily(cls, daily):
+        """Rebuild the aggregates from the sums per station-day alone."""
+        aggregates = cls()
+        aggregates._daily = [daily]
+        aggregates.stations = daily.groupby(level=STATION).sum()
+        return aggregates
+
+    @property
+    def daily(self):
+        if len(self._daily) > 1:
+            self._daily = [_sum_parts(self._daily)]
+        return self._daily[0]
+
+    def add(self, chunk):
+        """Fold one chunk of raw rows into the sums."""
+        # rows with missing values are dropped, exactly like in the cleaning notebook
+        chunk = chunk.dropna(subset=[STATION, DATE, RIDES, DELAY])
+        dates = pd.to_datetime(chunk[DATE].astype(str), format=DATE_FORMAT)
+
+        grouped = chunk.groupby([chunk[STATION], dates.rename(DATE)], observed=True)
+        part = grouped[[DELAY, RIDES]].sum().astype("float64")
+        part[COUNT] = grouped.size()
+
+        self._add_daily(part)
+        self.stations = _sum_parts([self.stations, part.groupby(level=STATION).sum()])
+        return self
+
+    def merge(self, other):
+        """Add the sums of another Aggregates object (e.g. of a different month)."""
+        self._add_daily(other.daily)
+        self.stations = _sum_parts([self.stations, other.stations])
+        return self
+
+    def remove(self, other):
+        """Subtract the sums of another Aggregates object that was merged before."""
+        self._daily = [_drop_empty(self.daily.sub(other.daily, fill_value=0))]
+        self.stations = _drop_empty(self.stations.sub(other.stations, fill_value=0))
+        return self
+
+    def station_means(self):
+        """Mean number of train rides and mean minutes of delay per station (over all days)."""
+        means = self.stations[[RIDES, DELAY]].div(self.stations[COUNT], axis=0)
+        return means[self.stations[COUNT] > 0]
+
+    def _add_daily(self, part):
+        self._daily.append(part)
+        if len(self._daily) > self.max_pending:
+            self._daily = [_sum_parts(self._daily)]
+
+
+def aggregate(paths, chunksize=CHUNKSIZE, workers=1):
+    """
+    Stream the given monthly files into a single Aggregates object.
+
+    With workers > 1 (or None for one per core) the files are aggregated in a process pool, one file per
+    task, and only the partial aggregates are sent back and merged. Scripts that use this have to guard
+    their top level code with `if __name__ == "__main__":` on platforms that spawn worker processes.
+    """
+    return merge_all(aggregate_files(paths, chunksize, workers))
+
+
+def aggregate_files(paths, chunksize=CHUNKSIZE, workers=1):
+    """Aggregates of every single file (in the order of `paths`), optionally in a process pool."""
+    if isinstance(paths, str):
+        paths = [paths]
+    if workers == 1 or len(paths) < 2:
+        return [_aggregate_file(path, chunksize) for path in paths]
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(_aggregate_file, paths, [chunksize] * len(paths)))
+
+
+def merge_all(parts):
+    """Merge any number of Aggregates objects into a new one."""
+    aggregates = Aggregates()
+    for part in parts:
+        aggregates.merge(part)
+    return aggregates
+
+
+def _aggregate_file(path, chunksize):
+    aggregates = Aggregates()
+    for chunk in iter_chunks(path, chunksize):
+        aggregates.add(chunk)
+    return aggregates
+
+
+def mean_table(aggregates, stations, country="DEUTSCHLAND"):
+    """
+    Mean rides and delay per station joined with the station names and coordinates.
+
+    This is the `data_mean` table of the cleaning notebook (before dropping stations with few rides),
+    computed from the aggregates instead of the raw rows.
+    """
+    return join_stations(aggregates.station_means(), stations, country)
+
+
+def join_stations(means, stations, country="DEUTSCHLAND"):
+    """Join means indexed by station with the names and coordinates of the stations of `country`."""
+    stations = stations[stations["Country"] == country]
+    stations = stations.drop(columns=["Country"]).dropna().drop_duplicates()
+    data_mean = pd.merge(stations, means, left_on=STATION, right_index=True, how="inner")
+    return data_mean.reset_index(drop=True)
+
+
+def _empty(index):
+    empty = pd.DataFrame({DELAY: pd.Series(dtype="float64"), RIDES: pd.Series(dtype="float64"),
+                          COUNT: pd.Series(dtype="int64")})
+    if len(index) == 1:
+        return empty.rename_axis(index[0])
+    return empty.set_index(pd.MultiIndex.from_arrays([[], []], names=index))
+
+
+def _drop_empty(sums):
+    sums[COUNT] = sums[COUNT].round().astype("int64")
+    return sums[sums[COUNT] > 0]
+
+
+def _sum_parts(parts):
+    index = list(parts[0].index.names)
+    parts = [part for part in parts if len(part)]
+    if not parts:
+        return _empty(index)
+    if len(parts) == 1:
+        return parts[0]
+    return pd.concat(parts).groupby(level=index).sum()
@@ -0,0 +1,69 @@
+"""
+Matching of stations to the routes they lie on, through an STRtree over the route lines.
+
+Instead of computing the distance of every station to every line, the bounding boxes of all lines are
+indexed once and all stations are queried in bulk: only the few lines whose boxes are within the
+threshold of a station are compared with it exactly. If the routes are in a projected CRS (see
+`projection.METRIC_CRS`), the stations are projected into it as well and thresholds are in metres.
+"""
+
+import numpy as np
+import pandas as pd
+import shapely
+
+from reliability.projection import GEOGRAPHIC_CRS, is_geographic, project
+
+
+def within(points, lines, threshold):
+    """Indices of all (point, line) pairs closer than `threshold`, with their distances."""
+    points = np.asarray(points)
+    lines = np.asarray(lines)
+    tree = shapely.STRtree(lines)
+    point, line = tree.query(points, predicate="dwithin", distance=threshold)
+    distance = shapely.distance(points[point], lines[line])
+
+    # dwithin also keeps pairs at exactly the threshold
+    keep = distance < threshold
+    return point[keep], line[keep], distance[keep]
+
+
+def stations_within(stations, routes, threshold=1000):
+    """
+    All stations (with "Coordinate Longitude" and "Coordinate Latitude") within `threshold` of a
+    route (with "strecke_nr" and a line geometry), one row per match: station, route and distance.
+    The threshold and distances are in the units of the routes' CRS (metres for `METRIC_CRS`).
+    """
+    point, line, distance = within(station_points(stations, routes.crs), routes.geometry.to_numpy(), threshold)
+    return pd.DataFrame({"Station or stop": stations["Station or stop"].to_numpy()[point],
+                         "Route": routes["strecke_nr"].to_numpy()[line],
+                         "Distance": distance})
+
+
+def nearest_routes(routes, stations, distance_threshold=1000, candidates=1):
+    """
+    The `candidates` nearest routes of every station that are at most `distance_threshold` away,
+    nearest first (one row per station and route: station, route and distance).
+    """
+    points = station_points(stations, routes.crs)
+    lines = routes.geometry.to_numpy()
+    point, line = shapely.STRtree(lines).query(points, predicate="dwithin", distance=distance_threshold)
+    matches = pd.DataFrame({"point": point, "line": line,
+                            "Station or stop": stations["Station or stop"].to_numpy()[point],
+                            "Route": routes["strecke_nr"].to_numpy()[line],
+                            "Distance": shapely.distance(points[point], lines[line])})
+
+    # nearest first, ties go to the first route; a route with several lines counts once per station
+    matches = matches.sort_values(["point", "Distance", "line"], kind="stable")
+    matches = matches.drop_duplicates(["point", "Route"])
+    matches = matches.groupby("point", sort=False).head(candidates)
+    return matches[["Station or stop", "Route", "Distance"]].reset_index(drop=True)
+
+
+def station_points(stations, crs=None):
+    """Points of the stations (in `crs`, longitude and latitude by default), None without coordinates."""
+    lon = stations["Coordinate Longitude"].to_numpy("float64")
+    lat = stations["Coordinate Latitude"].to_numpy("float64")
+    missing = np.isnan(lon) | np.isnan(lat)
+    x, y = (lon, lat) if is_geographic(crs) else project(lon, lat, GEOGRAPHIC_CRS, crs)
+    # stations without coordinates are missing geometries, which the STRtree never matches
+    return np.where(missing, None, shapely.points(x, y))
@@ -0,0 +1,174 @@
+"""
+Binary cache of the route network in strecken_polyline.shp.
+
+Reading the shapefile through fiona and grouping its lines by `strecke_nr` is slow, so the network is
+stored once as flat arrays: all coordinates, the offsets of every line part into them, of every
+feature (row of the shapefile) into the parts and of every route (`strecke_nr`) into the features.
+Loading these arrays takes milliseconds, shapely geometries are only rebuilt when they are needed.
+The network projected into the metric CRS (see `projection`) is cached the same way.
+"""
+
+import functools
+import hashlib
+import os
+
+import numpy as np
+import shapely
+
+from reliability import CACHE_DIR, DAT_DIR
+from reliability.columnar import file_stamp
+from reliability.projection import GEOGRAPHIC_CRS, project
+
+
+NETWORK_SHP = os.path.join(DAT_DIR, "geo-strecke", "strecken_polyline.shp")
+
+
+class RouteNetwork:
+    """Lines of all routes, as coordinate arrays with part, feature and route offsets."""
+
+    def __init__(self, coords, part_offsets, feature_offsets, route_offsets, strecke_nr, crs, stamp=None):
+        self.coords = coords
+        self.part_offsets = part_offsets
+        self.feature_offsets = feature_offsets
+        self.route_offsets = route_offsets
+        self.strecke_nr = strecke_nr
+        self.crs = crs
+        self.stamp = stamp
+
+    @classmethod
+    def load(cls, path=NETWORK_SHP, cache_dir=CACHE_DIR, crs=None):
+        """
+        The network of the shapefile at `path` (projected into `crs` if given, e.g. `METRIC_CRS`), from
+        the cache unless the shapefile changed.
+        """
+        name = os.path.splitext(os.path.basename(path))[0]
+        if crs is not None:
+            name += "-" + str(crs).replace(":", "_")
+        cache_path = os.path.join(cache_dir, name + ".npz")
+        stamp = _stamp(path)
+
+        if os.path.exists(cache_path):
+            network = cls.read(cache_path)
+            if network.stamp == stamp:
+                return network
+
+        if crs is not None:
+            network = cls.load(path, cache_dir).to_crs(crs)
+        else:
+            import geopandas as gpd
+            network = cls.from_geodataframe(gpd.read_file(path), stamp)
+        network.write(cache_path)
+        return network
+
+    @classmethod
+    def read(cls, path):
+        with np.load(path, allow_pickle=False) as arrays:
+            return cls(arrays["coords"], arrays["part_offsets"], arrays["feature_offsets"],
+                       arrays["route_offsets"], arrays["strecke_nr"], str(arrays["crs"]) or None,
+                       arrays["stamp"].tolist())
+
+    def write(self, path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + ".tmp", "wb") as f:
+            np.savez(f, coords=self.coords, part_offsets=self.part_offsets,
+                     feature_offsets=self.feature_offsets, route_offsets=self.route_offsets,
+                     strecke_nr=self.strecke_nr, crs=np.array(self.crs or ""),
+                     stamp=np.array(self.stamp or [], dtype="int64"))
+        os.replace(path + ".tmp", path)
+
+    @classmethod
+    def from_geodataframe(cls, gdf, stamp=None):
+        """Build from the lines of the shapefile (one LineString or MultiLineString per row)."""
+        # sort by route, but keep the order of the rows within a route (like groupby does)
+        gdf = gdf.iloc[np.argsort(gdf["strecke_nr"].to_numpy(), kind="stable")]
+        geoms = np.array([shapely.MultiLineString([geom]) if geom.geom_type == "LineString" else geom
+                          for geom in gdf.geometry])
+
+        _, coords, (part_offsets, feature_offsets) = shapely.to_ragged_array(
+            geoms, include_z=bool(shapely.has_z(geoms).any()))
+        strecke_nr, starts = np.unique(gdf["strecke_nr"].to_numpy(), return_index=True)
+        route_offsets = np.append(starts, len(gdf))
+        crs = gdf.crs.to_string() if gdf.crs is not None else None
+        return cls(coords, part_offsets, feature_offsets, route_offsets, strecke_nr, crs, stamp)
+
+    def __len__(self):
+        return len(self.strecke_nr)
+
+    def to_crs(self, crs):
+        """The same network with its coordinates transformed into `crs` (heights are kept)."""
+        coords = self.coords.copy()
+        coords[:, 0], coords[:, 1] = project(self.coords[:, 0], self.coords[:, 1],
+                                             self.crs or GEOGRAPHIC_CRS, crs)
+        return RouteNetwork(coords, self.part_offsets, self.feature_offsets, self.route_offsets,
+                            self.strecke_nr, str(crs), self.stamp)
+
+    @functools.cached_property
+    def index(self):
+        """Position of every `strecke_nr` in the route arrays."""
+        return dict(zip(self.strecke_nr.tolist(), range(len(self.strecke_nr))))
+
+    @functools.cached_property
+    def part_routes(self):
+        """Position of the route of every line part (parts are grouped by feature, features by route)."""
+        feature_of_part = np.repeat(np.arange(len(self.feature_offsets) - 1), np.diff(self.feature_offsets))
+        route_of_feature = np.repeat(np.arange(len(self)), np.diff(self.route_offsets))
+        return route_of_feature[feature_of_part]
+
+    @functools.cached_property
+    def parts(self):
+        """One LineString per line part of all routes."""
+        return shapely.from_ragged_array(shapely.GeometryType.LINESTRING, self.coords, (self.part_offsets,))
+
+    @functools.cached_property
+    def hashes(self):
+        """Hash of the lines of every route (its coordinates and parts), to find the routes that changed."""
+        parts = self.feature_offsets[self.route_offsets]
+        hashes = []
+        for first, last in zip(parts[:-1].tolist(), parts[1:].tolist()):
+            offsets = self.part_offsets[first:last + 1]
+            h = hashlib.blake2b(self.coords[offsets[0]:offsets[-1]].tobytes(), digest_size=16)
+            h.update((offsets - offsets[0]).tobytes())
+            hashes.append(h.hexdigest())
+        return np.array(hashes)
+
+    @functools.cached_property
+    def geometries(self):
+        """One MultiLineString per route (all lines with the same `strecke_nr`)."""
+        return self._multilines(self.feature_offsets[self.route_offsets])
+
+    @functools.cached_property
+    def feature_geometries(self):
+        """One line per feature (row of the shapefile), a LineString unless the feature has several parts."""
+        if (np.diff(self.feature_offsets) == 1).all():
+            return shapely.from_ragged_array(shapely.GeometryType.LINESTRING, self.coords, (self.part_offsets,))
+        return self._multilines(self.feature_offsets)
+
+    def geometry(self, strecke_nr):
+        """MultiLineString of a single route, without building the geometries of all other routes."""
+        i = self.index[strecke_nr]
+        first, last = self.feature_offsets[self.route_offsets[[i, i + 1]]]
+        offsets = self.part_offsets[first:last + 1]
+        return self._multilines(np.array([0, last - first]), offsets - offsets[0],
+                                self.coords[offsets[0]:offsets[-1]])[0]
+
+    def to_geodataframe(self, level="route"):
+        """GeoDataFrame with `strecke_nr` and geometry per route (like `continuous_gdf`) or per feature."""
+        import geopandas as gpd
+        if level == "route":
+            return gpd.GeoDataFrame({"strecke_nr": self.strecke_nr}, geometry=self.geometries,
+                                    crs=self.crs, index=self.strecke_nr)
+        counts = np.diff(self.route_offsets)
+        return gpd.GeoDataFrame({"strecke_nr": np.repeat(self.strecke_nr, counts)},
+                                geometry=self.feature_geometries, crs=self.crs)
+
+    def _multilines(self, geometry_offsets, part_offsets=None, coords=None):
+        part_offsets = self.part_offsets if part_offsets is None else part_offsets
+        coords = self.coords if coords is None else coords
+        return shapely.from_ragged_array(shapely.GeometryType.MULTILINESTRING, coords,
+                                         (part_offsets, geometry_offsets))
+
+
+def _stamp(path):
+    # the attributes (strecke_nr) live in the .dbf next to the .shp
+    dbf = os.path.splitext(path)[0] + ".dbf"
+    return file_stamp(path) + (file_stamp(dbf) if os.path.exists(dbf) else [])
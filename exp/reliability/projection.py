@@ -0,0 +1,34 @@
+"""
+Projection of the geographic coordinates (longitude, latitude) into a metric CRS.
+
+Distances in degrees mean different lengths at different latitudes (0.01 degrees are 0.7 to 1.1 km in
+Germany), so all distance thresholds work on coordinates in ETRS89 / UTM zone 32N, in metres. The
+transformers are created once per process, the projected stations and routes are cached with them
+(see `stations.StationDirectory` and `network.RouteNetwork.load`).
+"""
+
+import functools
+
+
+GEOGRAPHIC_CRS = "EPSG:4326"
+# ETRS89 / UTM zone 32N, covers Germany with little distortion
+METRIC_CRS = "EPSG:25832"
+
+
+@functools.lru_cache(maxsize=None)
+def transformer(source=GEOGRAPHIC_CRS, target=METRIC_CRS):
+    from pyproj import Transformer
+    return Transformer.from_crs(source, target, always_xy=True)
+
+
+def project(x, y, source=GEOGRAPHIC_CRS, target=METRIC_CRS):
+    """Coordinates (arrays or scalars, longitude and latitude by default) transformed into `target`."""
+    return transformer(str(source), str(target)).transform(x, y)
+
+
+def is_geographic(crs):
+    """Whether coordinates in `crs` are in degrees (no CRS is taken to be longitude and latitude)."""
+    if crs is None:
+        return True
+    from pyproj import CRS
+    return CRS.from_user_input(crs).is_geographic
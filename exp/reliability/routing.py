@@ -0,0 +1,281 @@
+"""
+Shortest paths by reliability over the junction-level graph.
+
+Enumerating all route sequences up to a depth and scoring them afterwards grows exponentially with the
+depth and misses every longer path. Instead, the cost of every stretch of a route (see
+`segments.SegmentGraph`) is the delay of its stations plus a small cost per kilometre, and the best
+path between two points is found by A*: the straight-line distance to the destination (in metres, the
+graph is in the metric CRS) times the cost per kilometre is the heuristic, so the search only expands
+the nodes towards the destination. A node is the centre of the points merged into it, so the stretch
+between two nodes can be shorter than the straight line between them; every segment is therefore
+charged at least that straight line, which keeps the heuristic consistent (it never overestimates the
+cost of a segment plus the heuristic of its other node). Every node is then settled at most once, with
+its cheapest cost, so the search is O(E log V) without any limit on the number of routes of a path.
+
+Alternatives come from Yen's algorithm: the next best loopless path deviates from one of the paths
+found so far at some node, so only one search per node of the last path is needed for the next one, and
+the paths are produced lazily, best first, without enumerating all of them.
+
+The trade-off between distance, delay and changes between routes is the Pareto front of the paths over
+these three criteria, found by a multi-criteria label-setting search: every node keeps only the labels
+(partial paths) that no other label at the node or at the destination dominates.
+
+For a temporal slice (weekdays, weekends, a day of the week, a month, holidays) the segments get the
+station means of that slice from the station x day cube (see `cube.DelayCube`), without going back
+to the raw rows. The router of every slice is built once, so a query for a slice costs the same as one
+over all days.
+"""
+
+import heapq
+import itertools
+import math
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+
+class RoutedPath:
+    """
+    A path through the segment graph: its nodes, segments, routes (in order), cost, length, summed
+    station delay and the number of stations with a delay along it.
+    """
+
+    def __init__(self, nodes, edges, routes, cost, length, delay, stations):
+        self.nodes = nodes
+        self.edges = edges
+        self.routes = routes
+        self.cost = cost
+        self.length = length
+        self.delay = delay
+        self.stations = stations
+
+    @property
+    def mean_delay(self):
+        """Mean delay of the stations along the path."""
+        return self.delay / self.stations if self.stations else float("nan")
+
+    @property
+    def changes(self):
+        """Number of changes from one route to another along the path."""
+        return max(len(self.routes) - 1, 0)
+
+    def __repr__(self):
+        return f"RoutedPath(routes={self.routes}, length={self.length:.0f}, mean_delay={self.mean_delay:.2f})"
+
+
+class Router:
+    """
+    A* over a `SegmentGraph`. The cost of a segment is its summed station delay plus `per_km` (minutes
+    of delay a kilometre is worth, so that detours over lines without stations are not free) times its
+    length, or the distance between its nodes if that is longer.
+    """
+
+    def __init__(self, segments, per_km=0.1):
+        self.segments = segments
+        self.per_km = per_km
+        chord = np.hypot(*(segments.xy[segments.source] - segments.xy[segments.target]).T)
+        self.cost = segments.delay_sum + per_km * np.maximum(segments.length, chord) / 1000
+        # plain lists for the searches, built once (Yen's algorithm runs one search per spur node)
+        self.costs = self.cost.tolist()
+        self.x, self.y = segments.xy[:, 0].tolist(), segments.xy[:, 1].tolist()
+        self.tree = cKDTree(segments.xy)
+
+        # adjacency of the nodes in both directions, with the segment of every entry
+        source = np.concatenate([segments.source, segments.target])
+        target = np.concatenate([segments.target, segments.source])
+        order = np.argsort(source, kind="stable")
+        self.neighbours = target[order].tolist()
+        self.edges = (order % len(segments)).tolist()
+        self.indptr = np.append(0, np.cumsum(np.bincount(source, minlength=len(segments.xy)))).tolist()
+
+    def nearest_node(self, point):
+        """The node closest to a point (in the metric CRS)."""
+        return int(self.tree.query((point.x, point.y))[1])
+
+    def shortest_path(self, origin, destination, blocked_nodes=(), blocked_edges=()):
+        """
+        The cheapest path between two nodes as a `RoutedPath` (None if they are not connected), without
+        the nodes and segments given as blocked.
+        """
+        x, y = self.x, self.y
+        tx, ty = x[destination], y[destination]
+        scale = self.per_km / 1000
+        cost = self.costs
+        blocked_nodes, blocked_edges = set(blocked_nodes), set(blocked_edges)
+
+        best = {origin: 0.0}
+        previous = {origin: -1}
+        settled = set()
+        queue = [(scale * math.hypot(x[origin] - tx, y[origin] - ty), origin)]
+        while queue:
+            _, node = heapq.heappop(queue)
+            if node in settled:
+                continue
+            if node == destination:
+                return self._path(origin, destination, previous)
+            settled.add(node)
+            for k in range(self.indptr[node], self.indptr[node + 1]):
+                neighbour, edge = self.neighbours[k], self.edges[k]
+                if neighbour in settled or neighbour in blocked_nodes or edge in blocked_edges:
+                    continue
+                candidate = best[node] + cost[edge]
+                if candidate < best.get(neighbour, np.inf):
+                    best[neighbour] = candidate
+                    previous[neighbour] = edge
+                    heuristic = scale * math.hypot(x[neighbour] - tx, y[neighbour] - ty)
+                    heapq.heappush(queue, (candidate + heuristic, neighbour))
+        return None
+
+    def route(self, origin, destination):
+        """The most reliable path between two points (in the metric CRS), between their nearest nodes."""
+        return self.shortest_path(self.nearest_node(origin), self.nearest_node(destination))
+
+    def path(self, nodes, edges):
+        """`RoutedPath` of a sequence of nodes and the segments between them."""
+        segments = self.segments
+        routes = segments.route[edges].tolist()
+        # consecutive segments of the same route are one route of the path
+        routes = [route for k, route in enumerate(routes) if k == 0 or route != routes[k - 1]]
+        return RoutedPath(nodes, edges, routes, float(self.cost[edges].sum()),
+                          float(segments.length[edges].sum()), float(segments.delay_sum[edges].sum()),
+                          int(segments.delay_count[edges].sum()))
+
+    def alternatives(self, origin, destination):
+        """
+        The loopless paths between two points (in the metric CRS) as `RoutedPath`s, cheapest first,
+        computed one at a time (e.g. `itertools.islice(router.alternatives(a, b), 5)` for the five best).
+        """
+        return self.k_shortest_paths(self.nearest_node(origin), self.nearest_node(destination))
+
+    def k_shortest_paths(self, origin, destination):
+        """Yen's algorithm: the loopless paths between two nodes, cheapest first (a generator)."""
+        path = self.shortest_path(origin, destination)
+        if path is None:
+            return
+        found = [path]
+        seen = {tuple(path.edges)}
+        candidates = []
+        # ties are broken by the order the candidates were found in
+        counter = itertools.count()
+        while True:
+            yield path
+            last = found[-1]
+            for i in range(len(last.edges)):
+                # deviate from the last path at its i-th node: the path up to it is kept, its next
+                # segment on every path found so far with the same beginning is blocked
+                root_nodes, root_edges = last.nodes[:i + 1], last.edges[:i]
+                blocked_edges = {other.edges[i] for other in found
+                                 if len(other.edges) > i and other.edges[:i] == root_edges}
+                spur = self.shortest_path(last.nodes[i], destination, blocked_nodes=root_nodes[:-1],
+                                          blocked_edges=blocked_edges)
+                if spur is None:
+                    continue
+                edges = root_edges + spur.edges
+                if tuple(edges) not in seen:
+                    seen.add(tuple(edges))
+                    candidate = self.path(root_nodes[:-1] + spur.nodes, edges)
+                    heapq.heappush(candidates, (candidate.cost, next(counter), candidate))
+            if not candidates:
+                return
+            path = heapq.heappop(candidates)[2]
+            found.append(path)
+
+    def pareto(self, origin, destination, max_changes=None):
+        """
+        The Pareto front of the paths between two points (in the metric CRS) over their length, summed
+        station delay and number of route changes, as `RoutedPath`s sorted by length.
+        """
+        return self.pareto_paths(self.nearest_node(origin), self.nearest_node(destination), max_changes)
+
+    def pareto_paths(self, origin, destination, max_changes=None):
+        """Multi-criteria label-setting search between two nodes (see `pareto`)."""
+        length = self.segments.length.tolist()
+        delay = self.segments.delay_sum.tolist()
+        routes = self.segments.route.tolist()
+
+        # a label is (length, delay, changes, node, route it arrived on, previous label, segment)
+        labels = [(0.0, 0.0, 0, origin, None, -1, -1)]
+        settled = {}
+        front = []
+        queue = [(0.0, 0.0, 0, 0)]
+        while queue:
+            label_length, label_delay, changes, i = heapq.heappop(queue)
+            node, route = labels[i][3], labels[i][4]
+            # labels are taken in lexicographic order, so none taken later can dominate this one
+            if any(_dominates(settled_label, labels[i]) for settled_label in settled.get(node, ())):
+                continue
+            if any(labels[j][0] <= label_length and labels[j][1] <= label_delay and labels[j][2] <= changes
+                   for j in front):
+                continue
+            settled.setdefault(node, []).append(labels[i])
+            if node == destination:
+                front.append(i)
+                continue
+
+            for k in range(self.indptr[node], self.indptr[node + 1]):
+                neighbour, edge = self.neighbours[k], self.edges[k]
+                change = changes + (route is not None and routes[edge] != route)
+                if max_changes is not None and change > max_changes:
+                    continue
+                label = (label_length + length[edge], label_delay + delay[edge], change, neighbour,
+                         routes[edge], i, edge)
+                if any(_dominates(settled_label, label) for settled_label in settled.get(neighbour, ())):
+                    continue
+                labels.append(label)
+                heapq.heappush(queue, (label[0], label[1], change, len(labels) - 1))
+
+        paths = []
+        for i in front:
+            nodes, edges = [], []
+            while i >= 0:
+                nodes.append(labels[i][3])
+                if labels[i][6] >= 0:
+                    edges.append(labels[i][6])
+                i = labels[i][5]
+            paths.append(self.path(nodes[::-1], edges[::-1]))
+        return paths
+
+    def _path(self, origin, destination, previous):
+        nodes, edges = [destination], []
+        while nodes[-1] != origin:
+            edge = previous[nodes[-1]]
+            edges.append(edge)
+            a, b = self.segments.source[edge], self.segments.target[edge]
+            nodes.append(int(a if b == nodes[-1] else b))
+        return self.path(nodes[::-1], edges[::-1])
+
+
+class SliceRouter:
+    """Routers over the same segments with the delays of temporal slices of a `DelayCube`."""
+
+    def __init__(self, segments, cube, per_km=0.1):
+        self.segments = segments
+        self.cube = cube
+        self.per_km = per_km
+        self.routers = {}
+
+    def router(self, which="all"):
+        """The `Router` of a slice (anything `DelayCube.mask` takes), built on first use."""
+        key = which if isinstance(which, (str, int, np.integer)) else None
+        if key in self.routers:
+            return self.routers[key]
+        segments = self.segments.with_delays(self.cube.station_means(which).reset_index())
+        router = Router(segments, self.per_km)
+        # explicit masks are not kept, they cannot be told apart
+        if key is not None:
+            self.routers[key] = router
+        return router
+
+    def route(self, origin, destination, which="all"):
+        """The most reliable path between two points (in the metric CRS) with the delays of a slice."""
+        return self.router(which).route(origin, destination)
+
+    def alternatives(self, origin, destination, which="all"):
+        """The loopless paths between two points with the delays of a slice, cheapest first."""
+        return self.router(which).alternatives(origin, destination)
+
+
+def _dominates(a, b):
+    # a label at the same node dominates another if it is no longer, no later and, counting one more
+    # change if it arrived on another route, has no more changes
+    return a[0] <= b[0] and a[1] <= b[1] and a[2] + (a[4] != b[4]) <= b[2]
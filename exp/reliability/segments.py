@@ -0,0 +1,187 @@
+"""
+Junction-level graph of the route network.
+
+In the route graph (see `graph.RouteGraph`) a whole `strecke_nr` is one node, so a path uses all of a
+route even if it only runs a few kilometres along it. Here the nodes are the junctions between routes
+(every contact of two routes, including routes that meet more than once and routes ending on another
+one, see `topology.RouteTopology`) and the endpoints of their lines (points closer than the snapping
+distance are one node), and every edge is the stretch of a route between two consecutive nodes along
+it. Each edge carries its length and the delay of the stations along it (sum, count and mean weighted
+by the number of train rides), so shortest paths and path scores only count the distance actually
+travelled.
+
+The segment of every station is kept, so the delays of another table of station means (e.g. of a
+temporal slice of `cube.DelayCube`) are summed onto the same segments with a few bincounts.
+"""
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+import shapely
+from scipy.sparse.csgraph import connected_components
+from scipy.spatial import cKDTree
+
+from reliability.endpoints import RouteEndpoints
+from reliability.topology import RouteTopology
+
+
+class SegmentGraph:
+    """Nodes (junctions and endpoints) and edges (stretches of routes between them) with their weights."""
+
+    def __init__(self, xy, source, target, route, start, end, station_ids, station_segments,
+                 delay_sum, delay_count, delay_mean):
+        self.xy = xy
+        self.source = source
+        self.target = target
+        self.route = route
+        self.start = start
+        self.end = end
+        self.station_ids = station_ids
+        self.station_segments = station_segments
+        self.delay_sum = delay_sum
+        self.delay_count = delay_count
+        self.delay_mean = delay_mean
+
+    @classmethod
+    def build(cls, network, chainage, stations, threshold=50):
+        """
+        Segments of a network in a metric CRS, with the delays of the stations (a DataFrame with "Station
+        or stop", "Minutes of delay" and "Number of train rides") at their chainage (`chainage.Chainage`
+        of the same network) summed per segment. Points closer than `threshold` metres are one node.
+        """
+        if not np.array_equal(chainage.strecke_nr, network.strecke_nr):
+            raise ValueError("chainage is not of the routes of this network")
+        topology = RouteTopology.build(network, threshold)
+        endpoints = RouteEndpoints(network)
+
+        # chainage of the start of every part along its route (the parts of a route are measured in the
+        # order they are stored), so a stretch never runs from one part into another
+        lengths = shapely.length(network.parts)
+        total_start = np.cumsum(lengths) - lengths
+        route_start = total_start[network.feature_offsets[network.route_offsets[:-1]]]
+        part_start = total_start - route_start[network.part_routes]
+
+        # candidate nodes: the connecting point of every contact (on both routes) and every endpoint
+        points = np.concatenate([topology.xy, topology.xy, endpoints.xy])
+        routes = np.concatenate([topology.source, topology.target, endpoints.route])
+        pairs = cKDTree(points).query_pairs(threshold, output_type="ndarray")
+        graph = sp.coo_matrix((np.ones(len(pairs)), (pairs[:, 0], pairs[:, 1])), shape=(len(points),) * 2)
+        _, nodes = connected_components(graph, directed=False)
+        xy = np.column_stack([np.bincount(nodes, points[:, k]) / np.bincount(nodes) for k in range(2)])
+
+        # part and chainage of every node on its route: the connecting points are located on the parts
+        # they connect, the endpoints are the start and end of their part
+        parts = np.concatenate([topology.parts[:, 0], topology.parts[:, 1]])
+        positions = part_start[parts] + shapely.line_locate_point(network.parts[parts],
+                                                                  shapely.points(points[:len(parts)]))
+        endpoint_parts = np.repeat(np.arange(len(lengths)), 2)
+        endpoint_positions = part_start[endpoint_parts] + np.tile([0, 1], len(lengths)) * lengths[endpoint_parts]
+        positions = np.concatenate([positions, endpoint_positions])
+        parts = np.concatenate([parts, endpoint_parts])
+
+        # sorted along the routes
+        order = np.lexsort((positions, parts))
+        routes, parts, nodes, positions = routes[order], parts[order], nodes[order], positions[order]
+
+        offsets = np.searchsorted(routes, np.arange(len(network) + 1))
+        edges = []
+        # segment of every station of the chainage (-1 on routes without segments)
+        station_segments = np.full(len(chainage.station_ids), -1)
+        station_positions = part_start[chainage.parts] + chainage.part_positions()
+        segments = 0
+        for i, strecke_nr in enumerate(network.strecke_nr.tolist()):
+            route = slice(offsets[i], offsets[i + 1])
+            # stretches between consecutive nodes on the same part (points within the snapping distance
+            # of each other are the same node, they do not make a stretch)
+            link = (parts[route][1:] == parts[route][:-1]) & (nodes[route][1:] != nodes[route][:-1])
+            if not link.any():
+                continue
+            source, target = nodes[route][:-1][link], nodes[route][1:][link]
+            start, end = positions[route][:-1][link], positions[route][1:][link]
+
+            # every station belongs to the stretch it lies on (the stretches cover the parts in order),
+            # measured like the stretches from the start of its part
+            window = slice(chainage.offsets[i], chainage.offsets[i + 1])
+            segment = np.searchsorted(start, station_positions[window], side="right") - 1
+            station_segments[window] = segments + np.clip(segment, 0, len(start) - 1)
+            segments += len(start)
+            edges.append(pd.DataFrame({"source": source, "target": target, "route": strecke_nr,
+                                       "start": start, "end": end}))
+
+        # a network without any stretch (e.g. every route shorter than the threshold) has no edges
+        edges = pd.concat(edges, ignore_index=True) if edges else pd.DataFrame(
+            {"source": np.array([], dtype=nodes.dtype), "target": np.array([], dtype=nodes.dtype),
+             "route": network.strecke_nr[:0], "start": np.array([], dtype="float64"),
+             "end": np.array([], dtype="float64")})
+        graph = cls(xy, edges["source"].to_numpy(), edges["target"].to_numpy(), edges["route"].to_numpy(),
+                    edges["start"].to_numpy(), edges["end"].to_numpy(), chainage.station_ids, station_segments,
+                    None, None, None)
+        graph.delay_sum, graph.delay_count, graph.delay_mean = graph.aggregate(stations)
+        return graph
+
+    def aggregate(self, stations):
+        """
+        Sum, count and mean weighted by the number of train rides of the station delays (a DataFrame with
+        "Station or stop", "Minutes of delay" and "Number of train rides") on every segment.
+        """
+        values = stations.set_index("Station or stop")
+        delay = values["Minutes of delay"].reindex(self.station_ids).to_numpy("float64")
+        rides = values["Number of train rides"].reindex(self.station_ids).to_numpy("float64")
+        seen = ~np.isnan(delay) & (self.station_segments >= 0)
+        weighted = seen & ~np.isnan(rides)
+        segment = self.station_segments
+        delay_sum = np.bincount(segment[seen], delay[seen], len(self))
+        delay_count = np.bincount(segment[seen], minlength=len(self))
+        with np.errstate(invalid="ignore", divide="ignore"):
+            delay_mean = (np.bincount(segment[weighted], (delay * rides)[weighted], len(self))
+                          / np.bincount(segment[weighted], rides[weighted], len(self)))
+        return delay_sum, delay_count, delay_mean
+
+    def with_delays(self, stations):
+        """The same segments with the delays of another table of station means (see `aggregate`)."""
+        return SegmentGraph(self.xy, self.source, self.target, self.route, self.start, self.end,
+                            self.station_ids, self.station_segments, *self.aggregate(stations))
+
+    def __len__(self):
+        return len(self.source)
+
+    @property
+    def length(self):
+        """Length of every segment in metres."""
+        return self.end - self.start
+
+    def matrix(self, weight="length"):
+        """
+        Symmetric CSR matrix of the nodes with the "length" or "delay_sum" of the edges, the smallest one
+        where several routes connect the same two nodes (e.g. for scipy.sparse.csgraph).
+        """
+        values = getattr(self, weight)
+        rows = np.concatenate([self.source, self.target])
+        columns = np.concatenate([self.target, self.source])
+        values = np.concatenate([values, values])
+        # keep the smallest weight of parallel edges (a CSR matrix would sum them)
+        order = np.lexsort((values, columns, rows))
+        first = np.ones(len(order), dtype=bool)
+        first[1:] = (np.diff(rows[order]) != 0) | (np.diff(columns[order]) != 0)
+        order = order[first]
+        return sp.csr_matrix((values[order], (rows[order], columns[order])), shape=(len(self.xy),) * 2)
+
+    def to_frame(self):
+        """One row per segment: nodes, "Route", chainages, "Distance" and the delay aggregates."""
+        return pd.DataFrame({"source": self.source, "target": self.target, "Route": self.route,
+                             "Start": self.start, "End": self.end, "Distance": self.length,
+                             "Delay sum": self.delay_sum, "Delay count": self.delay_count,
+                             "Delay mean": self.delay_mean})
+
+    def to_networkx(self):
+        """Undirected multigraph of the nodes (with their "pos"), one edge per segment keyed by its route."""
+        import networkx as nx
+        graph = nx.MultiGraph()
+        graph.add_nodes_from((node, {"pos": xy}) for node, xy in enumerate(map(tuple, self.xy.tolist())))
+        graph.add_edges_from((a, b, route, {"length": length, "delay_sum": total, "delay_count": count,
+                                            "delay_mean": mean})
+                             for a, b, route, length, total, count, mean in
+                             zip(self.source.tolist(), self.target.tolist(), self.route.tolist(),
+                                 self.length.tolist(), self.delay_sum.tolist(), self.delay_count.tolist(),
+                                 self.delay_mean.tolist()))
+        return graph
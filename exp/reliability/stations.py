@@ -0,0 +1,104 @@
+"""
+Station directory built from GEO_Bahnstellen_EXPORT.csv.
+
+The directory keeps the attributes of every operating point as arrays sorted by station id, so single
+stations are looked up in O(1) (through a dict of positions) and whole id arrays with one vectorized
+gather, e.g. all coordinates of a route as shapely points without merging DataFrames. The coordinates
+projected into the metric CRS (see `projection`) are computed once and persisted with the directory.
+"""
+
+import os
+
+import numpy as np
+import shapely
+
+from reliability import CACHE_DIR
+from reliability.columnar import STATIONS_CSV, file_stamp, read_stations
+from reliability.compact import StationTable
+from reliability.projection import project
+
+
+class StationDirectory(StationTable):
+    """Station attributes keyed by station id."""
+
+    __slots__ = ("_positions", "_xy")
+
+    def __init__(self, *args, xy=None):
+        super().__init__(*args)
+        self._positions = None
+        self._xy = xy
+
+    @classmethod
+    def load(cls, path=STATIONS_CSV, cache_dir=CACHE_DIR):
+        """Directory of all stations in `path`, persisted in the cache until the csv changes."""
+        cache_path = os.path.join(cache_dir, "station_directory.npz")
+        stamp = file_stamp(path)
+
+        if os.path.exists(cache_path):
+            with np.load(cache_path, allow_pickle=False) as cached:
+                if cached["stamp"].tolist() == stamp and "x" in cached:
+                    return cls(*(cached[name] for name in StationTable.__slots__),
+                               xy=(cached["x"], cached["y"]))
+
+        directory = cls.from_frame(read_stations(path, cache_dir))
+        x, y = directory.xy
+        os.makedirs(cache_dir, exist_ok=True)
+        with open(cache_path + ".tmp", "wb") as f:
+            np.savez(f, stamp=np.array(stamp, dtype="int64"), x=x, y=y,
+                     **{name: getattr(directory, name) for name in StationTable.__slots__})
+        os.replace(cache_path + ".tmp", cache_path)
+        return directory
+
+    @property
+    def positions(self):
+        if self._positions is None:
+            self._positions = dict(zip(self.ids.tolist(), range(len(self.ids))))
+        return self._positions
+
+    def __contains__(self, station_id):
+        return station_id in self.positions
+
+    def __getitem__(self, station_id):
+        """Name, country and coordinates of a single station."""
+        i = self.positions[station_id]
+        # missing names and countries have code -1
+        name, country = self.name_codes[i], self.country_codes[i]
+        return {"Station or stop": int(self.ids[i]),
+                "Name": str(self.names[name]) if name >= 0 else np.nan,
+                "Country": str(self.countries[country]) if country >= 0 else np.nan,
+                "Coordinate Latitude": float(self.lat[i]),
+                "Coordinate Longitude": float(self.lon[i])}
+
+    def coordinates(self, ids):
+        """Longitude and latitude of every station id (NaN for unknown ids)."""
+        codes = self.codes(ids)
+        known = codes >= 0
+        lon = np.where(known, self.lon[codes], np.nan).astype("float64")
+        lat = np.where(known, self.lat[codes], np.nan).astype("float64")
+        return lon, lat
+
+    @property
+    def xy(self):
+        """Easting and northing of all stations in the metric CRS, in metres."""
+        if self._xy is None:
+            x, y = project(self.lon.astype("float64"), self.lat.astype("float64"))
+            # stations without coordinates stay NaN (pyproj returns inf for them)
+            missing = np.isnan(self.lon) | np.isnan(self.lat)
+            self._xy = np.where(missing, np.nan, x), np.where(missing, np.nan, y)
+        return self._xy
+
+    def projected(self, ids):
+        """Easting and northing in metres of every station id (NaN for unknown ids)."""
+        codes = self.codes(ids)
+        known = codes >= 0
+        x, y = self.xy
+        return np.where(known, x[codes], np.nan), np.where(known, y[codes], np.nan)
+
+    def points(self, ids, projected=False):
+        """Shapely points of every station id in one gather, (lon, lat) or in metres if `projected`."""
+        return shapely.points(*(self.projected(ids) if projected else self.coordinates(ids)))
+
+    def names_of(self, ids):
+        """Name of every station id ("" for unknown ids, NaN for stations without a name)."""
+        codes = self.codes(ids)
+        return np.where(codes >= 0, self.names_at(codes), "")
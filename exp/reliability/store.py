@@ -0,0 +1,118 @@
+"""
+Persistent store of the delay aggregates of all ingested months.
+
+The store keeps the running sums (delay, rides, number of rows) per station-day on disk, together with
+the sums of every single monthly file. Appending a new month only reads that month's csv and adds its
+sums, so a monthly refresh costs O(new rows) instead of rereading the whole history. If a month that
+was already ingested changes, its old sums are subtracted before the new ones are added.
+"""
+
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from reliability import CACHE_DIR
+from reliability.columnar import file_stamp
+from reliability.ingest import (CHUNKSIZE, COUNT, DATE, DELAY, RIDES, STATION, Aggregates, aggregate,
+                                aggregate_files, mean_table, monthly_files)
+
+
+STORE_DIR = os.path.join(CACHE_DIR, "aggregates")
+
+
+class AggregateStore:
+    """Aggregates of every ingested monthly file, persisted in `directory`."""
+
+    def __init__(self, directory=STORE_DIR):
+        self.directory = directory
+        self.manifest = {}
+        self.aggregates = Aggregates()
+
+        if os.path.exists(self._manifest_path):
+            with open(self._manifest_path) as f:
+                self.manifest = json.load(f)
+            self.aggregates = load_aggregates(self._path("totals.npz"))
+
+    @property
+    def _manifest_path(self):
+        return self._path("manifest.json")
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def append(self, path, chunksize=CHUNKSIZE):
+        """Add one monthly file to the store, returns False if it is already up to date."""
+        if not self._changed(path):
+            return False
+        self._add(path, aggregate([path], chunksize))
+        return True
+
+    def update(self, paths=None, chunksize=CHUNKSIZE, workers=1):
+        """
+        Append every new or changed monthly file (default: all Zugfahrten exports) and save.
+
+        With workers > 1 (or None for one per core) the new files are aggregated in a process pool,
+        see `ingest.aggregate`.
+        """
+        if paths is None:
+            paths = monthly_files()
+        changed = [path for path in paths if self._changed(path)]
+        for path, part in zip(changed, aggregate_files(changed, chunksize, workers)):
+            self._add(path, part)
+        if changed:
+            self.save()
+        return self
+
+    def _changed(self, path):
+        known = self.manifest.get(os.path.basename(path))
+        return known is None or known["stamp"] != file_stamp(path)
+
+    def _add(self, path, part):
+        name = os.path.basename(path)
+        known = self.manifest.get(name)
+        if known is not None:
+            # the file changed since we ingested it: take its old contribution out again
+            self.aggregates.remove(load_aggregates(self._path(known["part"])))
+        self.aggregates.merge(part)
+
+        part_name = os.path.join("parts", os.path.splitext(name)[0] + ".npz")
+        save_aggregates(self._path(part_name), part)
+        self.manifest[name] = {"stamp": file_stamp(path), "part": part_name}
+
+    def save(self):
+        save_aggregates(self._path("totals.npz"), self.aggregates)
+        with open(self._manifest_path + ".tmp", "w") as f:
+            json.dump(self.manifest, f, indent=1)
+        os.replace(self._manifest_path + ".tmp", self._manifest_path)
+
+    def station_means(self):
+        return self.aggregates.station_means()
+
+    def mean_table(self, stations):
+        return mean_table(self.aggregates, stations)
+
+
+def save_aggregates(path, aggregates):
+    """Write the sums per station-day as plain arrays into an .npz file."""
+    daily = aggregates.daily
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + ".tmp", "wb") as f:
+        np.savez(f,
+                 station=daily.index.get_level_values(STATION).to_numpy("int32"),
+                 date=daily.index.get_level_values(DATE).to_numpy("datetime64[D]"),
+                 delay=daily[DELAY].to_numpy("float64"),
+                 rides=daily[RIDES].to_numpy("float64"),
+                 count=daily[COUNT].to_numpy("int64"))
+    os.replace(path + ".tmp", path)
+
+
+def load_aggregates(path):
+    """Read aggregates written by `save_aggregates`."""
+    with np.load(path, allow_pickle=False) as arrays:
+        dates = pd.DatetimeIndex(arrays["date"].astype("datetime64[ns]"))
+        index = pd.MultiIndex.from_arrays([arrays["station"], dates], names=[STATION, DATE])
+        daily = pd.DataFrame({DELAY: arrays["delay"], RIDES: arrays["rides"], COUNT: arrays["count"]},
+                             index=index)
+    return Aggregates.from_daily(daily)
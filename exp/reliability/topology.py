@@ -0,0 +1,140 @@
+"""
+Topology of the route network: which routes connect, and where.
+
+Two routes are connected if any of their lines come closer than a threshold (50 m in the metric CRS),
+i.e. one ends on or near the other, or they cross. Instead of computing the distance between the parts
+of every pair of routes, all line parts go into one STRtree and a single bulk `dwithin` query returns
+the candidate pairs, so building the graph of the whole network is O(P log P) in the number of parts.
+Two routes can meet more than once (a chord leaving a line and joining it again, a loop, parallel
+lines), so every close pair of parts gives several candidate connecting points: the middle of the
+shortest line between them, the points where they cross and the endpoints of either part that lie
+close to the other (with the closest point on it). Candidates of the same two routes closer than the
+threshold to each other are one contact, kept at its closest point, and every separate contact is kept.
+"""
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+import shapely
+from scipy.sparse.csgraph import connected_components
+from scipy.spatial import cKDTree
+
+
+class RouteTopology:
+    """
+    Contacts between routes (`source` < `target`, sorted by the pair of routes with the closest contact
+    of every pair first) with their connecting points and the line parts of both routes they connect
+    (columns of `parts`, indices into `RouteNetwork.parts`).
+    """
+
+    def __init__(self, strecke_nr, source, target, xy, distance, parts):
+        self.strecke_nr = strecke_nr
+        self.source = source
+        self.target = target
+        self.xy = xy
+        self.distance = distance
+        self.parts = parts
+
+    @classmethod
+    def build(cls, network, threshold=50, routes=None):
+        """
+        Connections of all routes of a network in a metric CRS closer than `threshold` metres, or only
+        the connections of the routes at the positions `routes` (e.g. the routes that changed).
+        """
+        parts = network.parts
+        query = np.arange(len(parts)) if routes is None else np.flatnonzero(np.isin(network.part_routes, routes))
+        routes = network.part_routes
+        tree = shapely.STRtree(parts)
+        first, second = tree.query(parts[query], predicate="dwithin", distance=threshold)
+        first = query[first]
+
+        # pairs of parts of different routes, each pair of routes in one direction only
+        swap = routes[first] > routes[second]
+        first, second = np.where(swap, second, first), np.where(swap, first, second)
+        keep = routes[first] < routes[second]
+        first, second = first[keep], second[keep]
+        distance = shapely.distance(parts[first], parts[second])
+        close = distance < threshold
+        first, second, distance = first[close], second[close], distance[close]
+        # a pair of parts found from both sides (when only some routes are queried) counts once
+        unique = ~pd.DataFrame({"first": first, "second": second}).duplicated().to_numpy()
+        first, second, distance = first[unique], second[unique], distance[unique]
+
+        # candidate connecting points of every pair of parts: the middle of the shortest line between them,
+        # every crossing, and every endpoint of one part that lies close to the other (a route ending on
+        # another one) with its closest point on the other part
+        a, b = shapely.force_2d(parts[first]), shapely.force_2d(parts[second])
+        lines = [shapely.shortest_line(a, b)]
+        for ends, other in ((a, b), (b, a)):
+            lines += [shapely.shortest_line(shapely.get_point(ends, k), other) for k in (0, -1)]
+        lines = np.concatenate(lines)
+        pair = np.tile(np.arange(len(first)), 5)
+        distance = shapely.length(lines)
+        close = distance < threshold
+        lines, pair, distance = lines[close], pair[close], distance[close]
+        crossings, crossing_pair = shapely.get_coordinates(shapely.intersection(a, b), return_index=True)
+        xy = np.concatenate([shapely.get_coordinates(lines).reshape(-1, 2, 2).mean(axis=1), crossings])
+        pair = np.concatenate([pair, crossing_pair])
+        distance = np.concatenate([distance, np.zeros(len(crossings))])
+        source, target = routes[first][pair], routes[second][pair]
+
+        # connecting points of the same two routes closer than the threshold are one contact (e.g. the
+        # parts on either side of a crossing), kept at its closest point
+        pairs = cKDTree(xy).query_pairs(threshold, output_type="ndarray")
+        same = (source[pairs[:, 0]] == source[pairs[:, 1]]) & (target[pairs[:, 0]] == target[pairs[:, 1]])
+        pairs = pairs[same]
+        graph = sp.coo_matrix((np.ones(len(pairs)), (pairs[:, 0], pairs[:, 1])), shape=(len(xy),) * 2)
+        _, contacts = connected_components(graph, directed=False)
+        order = np.lexsort((distance, contacts))
+        closest = np.ones(len(order), dtype=bool)
+        closest[1:] = contacts[order][1:] != contacts[order][:-1]
+        closest = order[closest]
+
+        # sorted by the pair of routes, the closest contact of every pair first
+        closest = closest[np.lexsort((distance[closest], target[closest], source[closest]))]
+        pair = pair[closest]
+        return cls(network.strecke_nr, source[closest], target[closest], xy[closest], distance[closest],
+                   np.column_stack([first[pair], second[pair]]))
+
+    def __len__(self):
+        return len(self.source)
+
+    def adjacency(self):
+        """
+        For every `strecke_nr`, the connected routes as (strecke_nr, (x, y) of the connecting point),
+        once per contact.
+        """
+        adjacency = {strecke_nr: [] for strecke_nr in self.strecke_nr.tolist()}
+        source, target = self.strecke_nr[self.source].tolist(), self.strecke_nr[self.target].tolist()
+        for a, b, xy in zip(source, target, map(tuple, self.xy.tolist())):
+            adjacency[a].append((b, xy))
+            adjacency[b].append((a, xy))
+        return adjacency
+
+    def closest(self):
+        """Mask of the closest contact of every pair of routes (the first one of the pair)."""
+        closest = np.ones(len(self), dtype=bool)
+        closest[1:] = (np.diff(self.source) != 0) | (np.diff(self.target) != 0)
+        return closest
+
+    def to_frame(self):
+        """One row per contact: "Route", "Connected route", "Distance" and the "x", "y" of the contact."""
+        return pd.DataFrame({"Route": self.strecke_nr[self.source],
+                             "Connected route": self.strecke_nr[self.target],
+                             "Distance": self.distance,
+                             "x": self.xy[:, 0], "y": self.xy[:, 1]})
+
+    def to_networkx(self):
+        """
+        Undirected graph of the routes (nodes are `strecke_nr`), with the closest connecting point of
+        every pair as edge attribute "xy".
+        """
+        import networkx as nx
+        graph = nx.Graph()
+        graph.add_nodes_from(self.strecke_nr.tolist())
+        closest = self.closest()
+        graph.add_edges_from((a, b, {"xy": xy, "distance": d}) for a, b, xy, d in
+                             zip(self.strecke_nr[self.source[closest]].tolist(),
+                                 self.strecke_nr[self.target[closest]].tolist(),
+                                 map(tuple, self.xy[closest].tolist()), self.distance[closest].tolist()))
+        return graph